@@ -0,0 +1,129 @@
+"""Microbenchmark of subscription token verification.
+
+Compares `utils.auth` against the previous python-jose/pydantic
+implementation (kept below as a reference). Run from the repository root:
+
+    pip install python-jose
+    python -m benchmarks.auth
+"""
+
+import argparse
+import json
+import os
+import timeit
+from base64 import b64decode, b64encode, urlsafe_b64encode
+from datetime import datetime
+from hashlib import sha256
+import hmac
+
+SECRET = os.environ.setdefault("MARZBAN_JWT_TOKEN", "benchmark-secret-key")
+
+from pydantic import BaseModel  # noqa: E402
+from utils import auth  # noqa: E402
+
+try:
+    from jose import JWTError, jwt
+except ImportError:
+    jwt = None
+
+
+class ReferenceMarzbanToken(BaseModel):
+    username: str
+    created_at: datetime | str
+
+
+def make_legacy_token(username: str, created_at: int, secret: str = SECRET) -> str:
+    data = b64encode(f"{username},{created_at}".encode(), altchars=b"-_")
+    data = data.decode().rstrip("=")
+    signature = b64encode(sha256((data + secret).encode()).digest(), altchars=b"-_")
+    return data + signature.decode()[:10]
+
+
+def make_jwt_token(username: str, created_at: int, secret: str = SECRET) -> str:
+    def encode(raw: bytes) -> str:
+        return urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+    header = encode(b'{"alg":"HS256","typ":"JWT"}')
+    payload = encode(
+        json.dumps(
+            {"sub": username, "access": "subscription", "iat": created_at}
+        ).encode()
+    )
+    signature = hmac.new(
+        secret.encode(), f"{header}.{payload}".encode(), sha256
+    ).digest()
+    return f"{header}.{payload}.{encode(signature)}"
+
+
+def reference_payload(token: str, secret: str = SECRET):
+    """The pre-native implementation of `get_subscription_payload`."""
+    try:
+        if len(token) < 15:
+            return None
+
+        if token.startswith("eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9."):
+            payload = jwt.decode(token, secret, algorithms=["HS256"])
+            if payload.get("access") == "subscription":
+                return ReferenceMarzbanToken(
+                    username=payload["sub"],
+                    created_at=datetime.utcfromtimestamp(payload["iat"]),
+                )
+            return None
+
+        u_token, u_signature = token[:-10], token[-10:]
+        try:
+            u_token_dec = b64decode(
+                u_token.encode("utf-8") + b"=" * (-len(u_token.encode("utf-8")) % 4),
+                altchars=b"-_",
+                validate=True,
+            ).decode("utf-8")
+        except Exception:
+            return None
+
+        u_token_resign = b64encode(
+            sha256((u_token + secret).encode("utf-8")).digest(), altchars=b"-_"
+        ).decode("utf-8")[:10]
+        if u_signature == u_token_resign:
+            u_username, u_created_at = u_token_dec.split(",")
+            return ReferenceMarzbanToken(
+                username=u_username,
+                created_at=datetime.utcfromtimestamp(int(u_created_at)),
+            )
+        return None
+    except JWTError:
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    tokens = {
+        "jwt": make_jwt_token("benchmark_user", 1700000000),
+        "legacy": make_legacy_token("benchmark_user", 1700000000),
+        "garbage": "not-a-token!" * 4,
+    }
+
+    if jwt is None:
+        print("python-jose is not installed, skipping the reference implementation.")
+
+    print(f"{'case':<10}{'implementation':<18}{'us/op':>10}")
+    for name, token in tokens.items():
+        timings = {
+            "native": lambda: auth._verify_token(token),
+            "native+cache": lambda: auth.get_subscription_payload(token),
+        }
+        if jwt is not None:
+            reference = reference_payload(token)
+            native = auth._verify_token(token)
+            assert (reference is None) == (native is None), name
+            timings["python-jose"] = lambda: reference_payload(token)
+
+        for label, func in timings.items():
+            seconds = timeit.timeit(func, number=args.number)
+            print(f"{name:<10}{label:<18}{seconds / args.number * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
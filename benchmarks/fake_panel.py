@@ -0,0 +1,166 @@
+"""Stand-in for the Marzneshin panel, used by the handler benchmark.
+
+Serves the admin token, user and subscription endpoints the migration
+service calls, with configurable latency, payload size and error rate.
+It can also be run on its own to point a local deployment at:
+
+    python -m benchmarks.fake_panel --port 8765 --latency 0.02
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import time
+from functools import lru_cache
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+
+def _admin_token(lifetime: int = 86400) -> str:
+    def encode(raw: bytes) -> str:
+        return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+    claims = {"sub": "benchmark", "access": "sudo", "exp": int(time.time()) + lifetime}
+    header = encode(b'{"alg":"HS256","typ":"JWT"}')
+    return f"{header}.{encode(json.dumps(claims).encode())}.{encode(b'unsigned')}"
+
+
+@lru_cache(maxsize=4096)
+def _subscription(username: str, size: int) -> tuple[bytes, str]:
+    """A deterministic body of about `size` bytes for `username`, with its ETag."""
+    lines = []
+    total = 0
+    while total < size:
+        digest = hashlib.md5(f"{username}-{len(lines)}".encode()).hexdigest()
+        line = (
+            f"vless://{digest[:8]}-{digest[8:12]}-{digest[12:16]}-{digest[16:20]}-"
+            f"{digest[20:]}@edge{len(lines)}.example.com:443"
+            f"?security=tls&type=ws&path=%2F#{username}-{len(lines)}\n"
+        )
+        lines.append(line)
+        total += len(line)
+    body = "".join(lines).encode()
+    return body, f'"{hashlib.md5(body).hexdigest()}"'
+
+
+def create_app(
+    base_url: str,
+    latency: float = 0.0,
+    payload_size: int = 4096,
+    error_rate: float = 0.0,
+) -> Starlette:
+    """Build the fake panel.
+
+    Each response is delayed by `latency` seconds, +/-50%. A fraction
+    `error_rate` of user and subscription requests fail with a 500.
+    """
+    stats = {"token": 0, "user": 0, "subscription": 0, "not_modified": 0, "error": 0}
+
+    async def delay() -> None:
+        if latency:
+            await asyncio.sleep(latency * random.uniform(0.5, 1.5))
+
+    def failed() -> bool:
+        if error_rate and random.random() < error_rate:
+            stats["error"] += 1
+            return True
+        return False
+
+    async def token(request: Request) -> Response:
+        stats["token"] += 1
+        await delay()
+        return JSONResponse({"access_token": _admin_token(), "is_sudo": True})
+
+    async def user(request: Request) -> Response:
+        stats["user"] += 1
+        await delay()
+        if not request.headers.get("authorization", "").startswith("Bearer "):
+            return JSONResponse({"detail": "Not authenticated"}, status_code=401)
+        if failed():
+            return Response("Internal Server Error", status_code=500)
+
+        username = request.path_params["username"]
+        return JSONResponse(
+            {
+                "id": 1,
+                "username": username,
+                "activated": True,
+                "is_active": True,
+                "expired": False,
+                "data_limit_reached": False,
+                "enabled": True,
+                "used_traffic": 0,
+                "lifetime_used_traffic": 0,
+                "sub_revoked_at": None,
+                "created_at": "2020-01-01T00:00:00",
+                "service_ids": [1],
+                "subscription_url": f"{base_url}/sub/{username}/{hashlib.md5(username.encode()).hexdigest()}",
+                "owner_username": None,
+                "traffic_reset_at": None,
+                "expire_strategy": "never",
+            }
+        )
+
+    async def subscription(request: Request) -> Response:
+        stats["subscription"] += 1
+        await delay()
+        if failed():
+            return Response("Internal Server Error", status_code=500)
+
+        body, etag = _subscription(request.path_params["username"], payload_size)
+        headers = {
+            "etag": etag,
+            "subscription-userinfo": "upload=0; download=0; total=0; expire=0",
+            "profile-update-interval": "12",
+        }
+        if request.headers.get("if-none-match") == etag:
+            stats["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type="text/plain", headers=headers)
+
+    async def get_stats(request: Request) -> Response:
+        return JSONResponse(stats)
+
+    return Starlette(
+        routes=[
+            Route("/api/admins/token", token, methods=["POST"]),
+            Route("/api/users/{username}", user),
+            Route("/sub/{username}/{key}", subscription),
+            Route("/_stats", get_stats),
+        ]
+    )
+
+
+def serve(host: str, port: int, **options) -> None:
+    """Run the fake panel with uvicorn until the process is stopped."""
+    import uvicorn
+
+    app = create_app(f"http://{host}:{port}", **options)
+    uvicorn.run(app, host=host, port=port, log_level="warning", access_log=False)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--payload-size", type=int, default=4096)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    serve(
+        args.host,
+        args.port,
+        latency=args.latency,
+        payload_size=args.payload_size,
+        error_rate=args.error_rate,
+    )
+
+
+if __name__ == "__main__":
+    main()
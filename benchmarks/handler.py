@@ -0,0 +1,297 @@
+"""Load test of the subscription handler against a local fake panel.
+
+Starts `benchmarks.fake_panel` in a child process, builds the real app
+with `main.create_app` in this process and drives it through an
+in-memory ASGI transport with a mix of JWT and legacy tokens. Reports
+throughput, latency percentiles, CPU per request and memory growth, and
+saves them as JSON. Run from the repository root:
+
+    python -m benchmarks.handler --duration 30 --concurrency 64
+    python -m benchmarks.handler --compare benchmarks/results/<earlier>.json
+
+CPU time covers this process only, i.e. the app plus the load
+generator's own client, so compare runs with each other rather than
+reading it as the absolute cost of a request. Settings of the app can
+be changed through the usual environment variables; rate limits are off
+unless set, since every request comes from one client with few tokens.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from benchmarks import fake_panel
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+USER_AGENTS = (
+    "v2rayNG/1.8.19",
+    "Hiddify/2.0.5",
+    "ClashMeta/1.18.0",
+    "Streisand/1.5.6",
+    "sing-box/1.8.0",
+)
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _percentile(ordered: list[float], percent: float) -> float:
+    if not ordered:
+        return 0.0
+    index = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _make_tokens(users: int, jwt_ratio: float, invalid_ratio: float) -> list[str]:
+    from benchmarks.auth import make_jwt_token, make_legacy_token
+
+    tokens = []
+    for i in range(users):
+        username = f"user_{i:05d}"
+        if random.random() < jwt_ratio:
+            tokens.append(make_jwt_token(username, 1700000000))
+        else:
+            tokens.append(make_legacy_token(username, 1700000000))
+    invalid = int(len(tokens) * invalid_ratio)
+    tokens.extend(f"invalid-token-{i:08d}" for i in range(invalid))
+    return tokens
+
+
+async def _wait_for_panel(url: str, timeout: float = 10.0) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(f"{url}/_stats")
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+
+async def _run(args: argparse.Namespace, panel_url: str) -> dict:
+    import httpx
+
+    # Imported only now, since settings are read from the environment at import.
+    import main as service
+    from db.base import Base, engine
+    from routers.subscription import router
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    tokens = _make_tokens(args.users, args.jwt_ratio, args.invalid_ratio)
+    app = service.create_app()
+
+    latencies: list[float] = []
+    statuses: Counter[str] = Counter()
+    recording = False
+
+    async def worker(client: httpx.AsyncClient, deadline: float) -> None:
+        while time.perf_counter() < deadline:
+            token = random.choice(tokens)
+            headers = {
+                "user-agent": random.choice(USER_AGENTS),
+                "accept-encoding": "gzip",
+            }
+            started = time.perf_counter()
+            try:
+                response = await client.get(f"{router.prefix}/{token}", headers=headers)
+                status = str(response.status_code)
+            except Exception as e:
+                status = type(e).__name__
+            if recording:
+                latencies.append(time.perf_counter() - started)
+                statuses[status] += 1
+
+    async def phase(seconds: float) -> float:
+        deadline = time.perf_counter() + seconds
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(worker(client, deadline) for _ in range(args.concurrency))
+        )
+        return time.perf_counter() - started
+
+    async with service.lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            if args.warmup:
+                await phase(args.warmup)
+
+            recording = True
+            rss_start = _rss_bytes()
+            cpu_start = _cpu_seconds()
+            elapsed = await phase(args.duration)
+            cpu = _cpu_seconds() - cpu_start
+            rss_end = _rss_bytes()
+
+        async with httpx.AsyncClient() as panel:
+            panel_calls = (await panel.get(f"{panel_url}/_stats")).json()
+
+    latencies.sort()
+    count = len(latencies)
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "settings": vars(args),
+        "requests": count,
+        "statuses": dict(statuses),
+        "rps": round(count / elapsed, 1),
+        "latency_ms": {
+            "mean": round(sum(latencies) / count * 1000, 3) if count else 0.0,
+            "p50": round(_percentile(latencies, 50) * 1000, 3),
+            "p95": round(_percentile(latencies, 95) * 1000, 3),
+            "p99": round(_percentile(latencies, 99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3) if count else 0.0,
+        },
+        "cpu_us_per_request": round(cpu / count * 1e6, 1) if count else 0.0,
+        "rss_start_mb": round(rss_start / 2**20, 1),
+        "rss_end_mb": round(rss_end / 2**20, 1),
+        "rss_growth_mb": round((rss_end - rss_start) / 2**20, 1),
+        "panel_calls": panel_calls,
+    }
+
+
+def _report(result: dict, baseline: dict | None) -> None:
+    rows = [
+        ("requests", result["requests"], None),
+        ("rps", result["rps"], "rps"),
+        ("p50 ms", result["latency_ms"]["p50"], ("latency_ms", "p50")),
+        ("p95 ms", result["latency_ms"]["p95"], ("latency_ms", "p95")),
+        ("p99 ms", result["latency_ms"]["p99"], ("latency_ms", "p99")),
+        ("cpu us/req", result["cpu_us_per_request"], "cpu_us_per_request"),
+        ("rss growth MB", result["rss_growth_mb"], "rss_growth_mb"),
+    ]
+    for label, value, key in rows:
+        line = f"{label:<16}{value:>12}"
+        if baseline and key:
+            before = baseline
+            for part in (key,) if isinstance(key, str) else key:
+                before = before[part]
+            if before:
+                line += f"{(value - before) / before * 100:>+10.1f}%"
+        print(line)
+    print(f"{'statuses':<16}{json.dumps(result['statuses'])}")
+    print(f"{'panel calls':<16}{json.dumps(result['panel_calls'])}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--jwt-ratio", type=float, default=0.5)
+    parser.add_argument("--invalid-ratio", type=float, default=0.01)
+    parser.add_argument("--panel-port", type=int, default=8765)
+    parser.add_argument("--panel-latency", type=float, default=0.02)
+    parser.add_argument("--payload-size", type=int, default=4096)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output",
+        default=os.path.join(
+            ROOT,
+            "benchmarks",
+            "results",
+            f"handler-{datetime.now():%Y%m%d-%H%M%S}.json",
+        ),
+    )
+    parser.add_argument("--compare", help="earlier result file to show changes against")
+    args = parser.parse_args()
+    args.output = os.path.abspath(args.output)
+    if args.compare:
+        args.compare = os.path.abspath(args.compare)
+    random.seed(args.seed)
+
+    panel_url = f"http://127.0.0.1:{args.panel_port}"
+    panel = multiprocessing.Process(
+        target=fake_panel.serve,
+        args=("127.0.0.1", args.panel_port),
+        kwargs={
+            "latency": args.panel_latency,
+            "payload_size": args.payload_size,
+            "error_rate": args.error_rate,
+        },
+        daemon=True,
+    )
+    panel.start()
+
+    # The app keeps its database, lock and log files in the working
+    # directory, so run it in a scratch one.
+    workdir = tempfile.TemporaryDirectory(prefix="handler-bench-")
+    os.chdir(workdir.name)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    os.environ["MARZNESHIN_ADDRESS"] = panel_url
+    os.environ.setdefault("MARZNESHIN_USERNAME", "benchmark")
+    os.environ.setdefault("MARZNESHIN_PASSWORD", "benchmark")
+    os.environ.setdefault("MARZBAN_JWT_TOKEN", "benchmark-secret-key")
+    os.environ.setdefault("MARZBAN_XRAY_SUBSCRIPTION_PATH", "sub")
+    os.environ.setdefault("RATE_LIMIT_TOKEN_RATE", "0")
+    os.environ.setdefault("RATE_LIMIT_IP_RATE", "0")
+
+    try:
+        asyncio.run(_wait_for_panel(panel_url))
+        result = asyncio.run(_run(args, panel_url))
+    finally:
+        panel.terminate()
+        panel.join()
+        os.chdir(ROOT)
+        workdir.cleanup()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    _report(result, baseline)
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,8 @@
 from .base import Base, GetDB
-from .models import Token
-from .crud import TokenManager
+from .models import Token, UserMapping, SubscriptionSnapshot, UserReplicaState
+from .crud import (
+    TokenManager,
+    UserMappingManager,
+    SnapshotManager,
+    UserReplicaManager,
+)
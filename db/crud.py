@@ -1,5 +1,7 @@
+from datetime import datetime
+from sqlalchemy import delete, func, update
 from sqlalchemy.future import select
-from db import Token, GetDB
+from db import Token, UserMapping, SubscriptionSnapshot, UserReplicaState, GetDB
 from models import TokenUpsert, TokenData
 
 
@@ -26,3 +28,109 @@ class TokenManager:
             result = await db.execute(select(Token).where(Token.id == 1))
             token = result.scalar_one_or_none()
             return TokenData.from_orm(token) if token else None
+
+
+class UserMappingManager:
+    @staticmethod
+    async def get_all() -> dict[str, str]:
+        """Return every imported Marzban username with its Marzneshin username."""
+        async with GetDB() as db:
+            result = await db.execute(
+                select(UserMapping.marzban_username, UserMapping.marzneshin_username)
+            )
+            return dict(result.tuples().all())
+
+
+class SnapshotManager:
+    @staticmethod
+    async def get_all() -> list[SubscriptionSnapshot]:
+        """Return every on-disk snapshot, oldest fetch first."""
+        async with GetDB() as db:
+            result = await db.execute(
+                select(SubscriptionSnapshot).order_by(SubscriptionSnapshot.fetched_at)
+            )
+            return list(result.scalars().all())
+
+    @staticmethod
+    async def get(key: str) -> SubscriptionSnapshot | None:
+        async with GetDB() as db:
+            return await db.get(SubscriptionSnapshot, key)
+
+    @staticmethod
+    async def oldest(limit: int) -> list[SubscriptionSnapshot]:
+        async with GetDB() as db:
+            result = await db.execute(
+                select(SubscriptionSnapshot)
+                .order_by(SubscriptionSnapshot.fetched_at)
+                .limit(limit)
+            )
+            return list(result.scalars().all())
+
+    @staticmethod
+    async def total_size() -> int:
+        """Bytes on disk used by every worker's snapshots together."""
+        async with GetDB() as db:
+            result = await db.execute(
+                select(func.coalesce(func.sum(SubscriptionSnapshot.disk_size), 0))
+            )
+            return result.scalar_one()
+
+    @staticmethod
+    async def upsert(snapshot: SubscriptionSnapshot) -> None:
+        async with GetDB() as db:
+            await db.merge(snapshot)
+            await db.commit()
+
+    @staticmethod
+    async def delete(keys: list[str]) -> None:
+        if not keys:
+            return
+        async with GetDB() as db:
+            await db.execute(
+                delete(SubscriptionSnapshot).where(SubscriptionSnapshot.key.in_(keys))
+            )
+            await db.commit()
+
+
+class UserReplicaManager:
+    @staticmethod
+    async def save(users: str, version: str, synced_at: datetime) -> None:
+        async with GetDB() as db:
+            await db.merge(
+                UserReplicaState(
+                    id=1, users=users, version=version, synced_at=synced_at
+                )
+            )
+            await db.commit()
+
+    @staticmethod
+    async def touch(synced_at: datetime) -> bool:
+        """Mark the saved users as still current; False if none are saved."""
+        async with GetDB() as db:
+            result = await db.execute(
+                update(UserReplicaState)
+                .where(UserReplicaState.id == 1)
+                .values(synced_at=synced_at)
+            )
+            await db.commit()
+            return result.rowcount > 0
+
+    @staticmethod
+    async def state() -> tuple[str | None, datetime] | None:
+        """Return the version and sync time of the saved users, without them."""
+        async with GetDB() as db:
+            result = await db.execute(
+                select(UserReplicaState.version, UserReplicaState.synced_at).where(
+                    UserReplicaState.id == 1
+                )
+            )
+            row = result.one_or_none()
+            return tuple(row) if row is not None else None
+
+    @staticmethod
+    async def users() -> str | None:
+        async with GetDB() as db:
+            result = await db.execute(
+                select(UserReplicaState.users).where(UserReplicaState.id == 1)
+            )
+            return result.scalar_one_or_none()
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Integer, DateTime, String, func
+from sqlalchemy import Integer, DateTime, String, Text, func
 from sqlalchemy.orm import Mapped, mapped_column
 from db import Base
 
@@ -15,3 +15,43 @@ class Token(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
     )
+
+
+class UserMapping(Base):
+    __tablename__ = "user_mappings"
+
+    marzban_username: Mapped[str] = mapped_column(String(255), primary_key=True)
+    marzneshin_username: Mapped[str] = mapped_column(
+        String(32), nullable=False, index=True
+    )
+    marzneshin_id: Mapped[int] = mapped_column(Integer, nullable=True)
+    imported_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+
+class SubscriptionSnapshot(Base):
+    __tablename__ = "subscription_snapshots"
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    url: Mapped[str] = mapped_column(String(2048), nullable=False)
+    media_type: Mapped[str] = mapped_column(String(255), nullable=False)
+    headers: Mapped[str] = mapped_column(Text, nullable=False)
+    etag: Mapped[str] = mapped_column(String(255), nullable=True)
+    last_modified: Mapped[str] = mapped_column(String(64), nullable=True)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    fetched_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, index=True
+    )
+    version: Mapped[str] = mapped_column(String(16), nullable=True)
+    encodings: Mapped[str] = mapped_column(Text, nullable=True)
+    disk_size: Mapped[int] = mapped_column(Integer, nullable=True)
+
+
+class UserReplicaState(Base):
+    __tablename__ = "user_replica"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    users: Mapped[str] = mapped_column(Text, nullable=False)
+    synced_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    version: Mapped[str] = mapped_column(String(32), nullable=True)
@@ -1,7 +1,7 @@
 import asyncio
 import secrets
 
-from utils import helpers, logger, config, MarzneshinClient
+from utils import helpers, logger, config, MarzneshinClient, UserMappingWriter
 from models import ServiceCreate, AdminCreate, AdminUpdate
 from collections import defaultdict
 
@@ -100,40 +100,53 @@ async def main():
                 )
 
         logger.info("Starting user migration process...")
-        for admin, users in users_by_admin.items():
-            if admin not in services_by_admin:
-                logger.error(
-                    f"Skipping users for admin {admin} due to failed admin creation"
-                )
-                continue
+        with UserMappingWriter() as mappings:
+            for admin, users in users_by_admin.items():
+                if admin not in services_by_admin:
+                    logger.error(
+                        f"Skipping users for admin {admin} due to failed admin creation"
+                    )
+                    continue
 
-            logger.info(f"Processing users for admin: {admin} ({len(users)} users)")
+                logger.info(f"Processing users for admin: {admin} ({len(users)} users)")
 
-            async with MarzneshinClient() as api:
-                logger.info(f"Logging in as admin: {admin}")
-                check_login = await api.login(admin, f"{admin}{admin}")
-                if not check_login:
-                    logger.error(f"Failed to login as admin: {admin}")
-                    continue
+                async with MarzneshinClient() as api:
+                    logger.info(f"Logging in as admin: {admin}")
+                    check_login = await api.login(admin, f"{admin}{admin}")
+                    if not check_login:
+                        logger.error(f"Failed to login as admin: {admin}")
+                        continue
 
-                admin_service = services_by_admin.get(admin)
+                    admin_service = services_by_admin.get(admin)
 
-                for user in users:
-                    logger.info(f"Processing user: {user.username}")
+                    for user in users:
+                        logger.info(f"Processing user: {user.username}")
 
-                    try:
-                        new_user = helpers.parse_marz_user(user, admin_service)
-                        logger.debug(f"Data for {user.username}: {new_user.dict()}")
-                        created_user = await api.create_user(new_user)
-                        if not created_user:
-                            logger.error(f"Failed to create user: {user.username}")
-                            continue
+                        try:
+                            new_user = helpers.parse_marz_user(user, admin_service)
+                            if mappings.collides(user.username, new_user.username):
+                                logger.error(
+                                    f"Skipping user {user.username}: '{new_user.username}' is already taken by another Marzban user"
+                                )
+                                continue
 
-                        logger.info(f"Successfully created user: {user.username}")
+                            logger.debug(f"Data for {user.username}: {new_user.dict()}")
+                            created_user = await api.create_user(new_user)
+                            if not created_user:
+                                logger.error(f"Failed to create user: {user.username}")
+                                continue
 
-                    except Exception as e:
-                        logger.error(f"Error creating user {user.username}: {str(e)}")
-                        continue
+                            mappings.record(
+                                user.username, created_user.username, created_user.id
+                            )
+
+                            logger.info(f"Successfully created user: {user.username}")
+
+                        except Exception as e:
+                            logger.error(
+                                f"Error creating user {user.username}: {str(e)}"
+                            )
+                            continue
 
     logger.info("Migration Import process completed!")
 
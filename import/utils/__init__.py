@@ -9,3 +9,4 @@ except ValueError as e:
     raise
 
 from .panel import MarzneshinClient
+from .mapping import UserMappingWriter
@@ -68,6 +68,13 @@ def parse_marzban_data(
         return None
 
 
+def translate_username(username: str) -> str:
+    """Marzneshin username for a Marzban user; the handler resolves tokens with it."""
+    clean = re.sub(r"[^\w]", "", username.lower())
+    hash_str = str(int(hashlib.md5(username.encode()).hexdigest(), 16) % 10000).zfill(4)
+    return f"{clean}_{hash_str}"[:32]
+
+
 def parse_marz_user(old: MarzUserData, service: int) -> UserCreate:
     if old.data_limit:
         remaining_data = old.data_limit - old.used_traffic
@@ -84,13 +91,8 @@ def parse_marz_user(old: MarzUserData, service: int) -> UserCreate:
         else None
     )
 
-    username = old.username
-    clean = re.sub(r"[^\w]", "", username.lower())
-    hash_str = str(int(hashlib.md5(username.encode()).hexdigest(), 16) % 10000).zfill(4)
-    username = f"{clean}_{hash_str}"[:32]
-
     return UserCreate(
-        username=username,
+        username=translate_username(old.username),
         data_limit=data_limit,
         data_limit_reset_strategy=old.data_limit_reset_strategy,
         expire_strategy=(
@@ -0,0 +1,74 @@
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from utils import config, logger
+
+
+class UserMappingWriter:
+    """Records imported users in the subscription handler's `user_mappings` table."""
+
+    def __init__(self, db_path: str | Path = config.MIGRATION_DB_PATH):
+        self.db_path = Path(db_path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._rows: list[tuple[str, str, int, str]] = []
+        self._owners: dict[str, str] = {}
+
+    def __enter__(self):
+        if not self.db_path.exists():
+            logger.warning(
+                f"Handler database not found at {self.db_path}, user mappings will not be saved"
+            )
+            return self
+
+        conn = sqlite3.connect(self.db_path)
+        table = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name='user_mappings'"
+        ).fetchone()
+        if not table:
+            logger.warning(
+                "Handler database has no 'user_mappings' table, run 'alembic upgrade head' there first"
+            )
+            conn.close()
+            return self
+
+        self._conn = conn
+        self._owners = dict(
+            conn.execute(
+                "SELECT marzneshin_username, marzban_username FROM user_mappings"
+            )
+        )
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._conn is None:
+            return
+
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO user_mappings "
+                "(marzban_username, marzneshin_username, marzneshin_id, imported_at) "
+                "VALUES (?, ?, ?, ?)",
+                self._rows,
+            )
+        self._conn.close()
+        logger.info(f"Saved {len(self._rows)} user mappings to {self.db_path}")
+
+    def collides(self, marzban_username: str, marzneshin_username: str) -> bool:
+        """Whether another Marzban user already owns this Marzneshin username."""
+        owner = self._owners.get(marzneshin_username)
+        return owner is not None and owner != marzban_username
+
+    def record(
+        self, marzban_username: str, marzneshin_username: str, marzneshin_id: int
+    ) -> None:
+        self._owners[marzneshin_username] = marzban_username
+        self._rows.append(
+            (
+                marzban_username,
+                marzneshin_username,
+                marzneshin_id,
+                datetime.now(timezone.utc).replace(tzinfo=None).isoformat(sep=" "),
+            )
+        )
@@ -1,6 +1,76 @@
 from decouple import config
 import re
+import atexit
+import copy
+import json
 import logging
+import queue
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RepeatFilter(logging.Filter):
+    """Pass an identical warning or error once per `window` seconds."""
+
+    def __init__(self, window: float, max_keys: int = 1024):
+        super().__init__()
+        self.window = window
+        self.max_keys = max_keys
+        self._seen: dict[tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.window <= 0 or record.levelno < logging.WARNING:
+            return True
+
+        key = (record.levelno, record.getMessage())
+        now = time.monotonic()
+        seen = self._seen.get(key)
+        if seen is not None and now - seen[0] < self.window:
+            seen[1] += 1
+            return False
+
+        if seen is not None and seen[1]:
+            record.msg = f"{key[1]} ({seen[1]} repeats suppressed)"
+            record.args = None
+        if len(self._seen) >= self.max_keys:
+            self._seen.clear()
+        self._seen[key] = [now, 0]
+        return True
+
+
+class _QueueHandler(QueueHandler):
+    """Drop records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Leave formatting, including any traceback, to the target handlers.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
 
 
 class SystemConfig:
@@ -24,15 +94,37 @@ class SystemConfig:
             console_handler = logging.StreamHandler()
             console_handler.setLevel(logging.DEBUG)
 
-            file_handler = logging.FileHandler(f"{bot_name}.log")
+            file_handler = RotatingFileHandler(
+                f"{bot_name}.log",
+                maxBytes=config(
+                    "LOG_FILE_MAX_BYTES", default=10 * 1024 * 1024, cast=int
+                ),
+                backupCount=config("LOG_FILE_BACKUPS", default=5, cast=int),
+            )
             file_handler.setLevel(logging.INFO)
 
-            formatter = logging.Formatter("%(levelname)-8s | %(message)s")
+            if config("LOG_JSON", default=False, cast=bool):
+                formatter = JsonFormatter()
+            else:
+                formatter = logging.Formatter("%(levelname)-8s | %(message)s")
             console_handler.setFormatter(formatter)
             file_handler.setFormatter(formatter)
 
-            logger.addHandler(console_handler)
-            logger.addHandler(file_handler)
+            # Handlers write from a listener thread, off the importer's requests.
+            log_queue = queue.Queue(
+                maxsize=config("LOG_QUEUE_SIZE", default=10000, cast=int)
+            )
+            listener = QueueListener(
+                log_queue, console_handler, file_handler, respect_handler_level=True
+            )
+            listener.start()
+            atexit.register(listener.stop)
+
+            queue_handler = _QueueHandler(log_queue)
+            queue_handler.addFilter(
+                RepeatFilter(config("LOG_REPEAT_WINDOW", default=10.0, cast=float))
+            )
+            logger.addHandler(queue_handler)
 
             SystemConfig._logger = logger
 
@@ -47,6 +139,11 @@ class SystemConfig:
             MARZBAN_USERS_DATA=config(
                 "MARZBAN_USERS_DATA", default="marzban.json", cast=str
             ),
+            MIGRATION_DB_PATH=config(
+                "MIGRATION_DB_PATH",
+                default="/opt/erfjab/migration/db.sqlite3",
+                cast=str,
+            ),
         )
 
     @staticmethod
@@ -85,8 +182,10 @@ class ConfigData:
         MARZNESHIN_PASSWORD: str,
         MARZNESHIN_ADDRESS: str,
         MARZBAN_USERS_DATA: str,
+        MIGRATION_DB_PATH: str,
     ):
         self.MARZNESHIN_USERNAME = MARZNESHIN_USERNAME
         self.MARZNESHIN_PASSWORD = MARZNESHIN_PASSWORD
         self.MARZNESHIN_ADDRESS = MARZNESHIN_ADDRESS
         self.MARZBAN_USERS_DATA = MARZBAN_USERS_DATA
+        self.MIGRATION_DB_PATH = MIGRATION_DB_PATH
@@ -0,0 +1,26 @@
+from utils import upstream
+from utils.leader import is_leader
+from utils.log import logger
+from utils.snapshots import SnapshotStore
+from utils.config import UVICORN_WORKERS
+
+
+async def refresh_ahead() -> int:
+    """Refetch the hottest subscriptions before their cached copies expire.
+
+    With several workers sharing the disk tier, only the leader refetches;
+    the others serve its fresh snapshots once their own copies expire.
+    Without the disk tier each worker keeps its own cache warm.
+    """
+    if UVICORN_WORKERS > 1 and SnapshotStore.enabled() and not is_leader():
+        return 0
+
+    try:
+        refreshed = await upstream.refresh_hot()
+        if refreshed:
+            logger.debug(f"Refreshed {refreshed} hot subscriptions ahead of expiry.")
+        return refreshed
+
+    except Exception as e:
+        logger.error(f"An unexpected 'REFRESH_AHEAD' error occurred: {str(e)}")
+        return 0
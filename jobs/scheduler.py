@@ -1,35 +1,150 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from jobs.token_updater import token_update
+from jobs.user_sync import user_sync
+from jobs.refresh_ahead import refresh_ahead
+from utils import upstream
+from utils.token_store import TokenStore
+from utils.leader import acquire_leadership
+from utils.usernames import UsernameIndex
 from utils.log import logger
+from utils.config import (
+    TOKEN_REFRESH_INTERVAL,
+    TOKEN_REFRESH_MARGIN,
+    TOKEN_REFRESH_JITTER,
+    TOKEN_RETRY_INTERVAL,
+    TOKEN_SYNC_INTERVAL,
+    USER_SYNC_ENABLED,
+    USER_SYNC_INTERVAL,
+    REFRESH_AHEAD_ENABLED,
+    REFRESH_AHEAD_INTERVAL,
+    REFRESH_AHEAD_DECAY_INTERVAL,
+    USERNAME_INDEX_INTERVAL,
+)
 
 scheduler = AsyncIOScheduler()
 
 
+def schedule_token_update(succeeded: bool) -> None:
+    """Plan the next token refresh ahead of the current token's expiry."""
+    expires_at = TokenStore.expires_at()
+    if not succeeded:
+        delay = TOKEN_RETRY_INTERVAL
+    elif expires_at:
+        delay = expires_at - time.time() - TOKEN_REFRESH_MARGIN
+        delay -= random.uniform(0, TOKEN_REFRESH_JITTER)
+        delay = max(delay, TOKEN_RETRY_INTERVAL)
+    else:
+        delay = TOKEN_REFRESH_INTERVAL
+
+    run_date = datetime.now(timezone.utc) + timedelta(seconds=delay)
+    scheduler.add_job(
+        token_update_job,
+        trigger=DateTrigger(run_date=run_date),
+        id="token_update",
+        replace_existing=True,
+        # The job schedules its own successor, so a run skipped as misfired
+        # would end the refreshes for good; run it late instead.
+        misfire_grace_time=None,
+        coalesce=True,
+    )
+    logger.info(f"Next token update scheduled at {run_date.isoformat()}.")
+
+
+async def token_update_job() -> None:
+    schedule_token_update(await token_update())
+
+
+async def token_follow_job() -> None:
+    """Pick up the token saved by the leader worker, or take over if it is gone."""
+    if acquire_leadership():
+        logger.info("This worker now refreshes the panel token.")
+        scheduler.remove_job("token_follow")
+        await token_update_job()
+        return
+
+    try:
+        await TokenStore.load()
+    except Exception as e:
+        logger.error(f"An error occurred while reloading the token: {e}")
+
+
 async def start_scheduler() -> bool:
     logger.info("Trying to start the scheduler.")
 
     try:
-        logger.info("Testing token update job...")
-        test_token = await token_update()
-        if not test_token:
-            logger.error("Token update test failed. Scheduler will not start.")
-            return False
+        if await TokenStore.load():
+            logger.info("Restored the persisted panel token.")
 
-        logger.info("Token update test succeeded.")
+        leader = acquire_leadership()
+        if leader:
+            logger.info("Testing token update job...")
+            test_token = await token_update()
+            if test_token:
+                logger.info("Token update test succeeded.")
+            else:
+                logger.error("Token update test failed. Retrying in the background.")
+        else:
+            test_token = TokenStore.get() is not None
+            logger.info("Another worker refreshes the token, following it instead.")
 
         scheduler.start()
         logger.info("Scheduler started successfully.")
 
-        scheduler.add_job(
-            token_update,
-            trigger=IntervalTrigger(hours=8),
-            id="token_update",
-            replace_existing=True,
-        )
+        if leader:
+            schedule_token_update(test_token)
+            logger.info("Token update job added to scheduler with ID 'token_update'.")
+        else:
+            scheduler.add_job(
+                token_follow_job,
+                trigger=IntervalTrigger(seconds=TOKEN_SYNC_INTERVAL),
+                id="token_follow",
+                replace_existing=True,
+            )
+            logger.info("Token follow job added to scheduler with ID 'token_follow'.")
+
+        if USER_SYNC_ENABLED:
+            scheduler.add_job(
+                user_sync,
+                trigger=IntervalTrigger(seconds=USER_SYNC_INTERVAL),
+                id="user_sync",
+                replace_existing=True,
+                next_run_time=datetime.now(timezone.utc),
+            )
+            logger.info("User sync job added to scheduler with ID 'user_sync'.")
+
+        if USERNAME_INDEX_INTERVAL > 0:
+            scheduler.add_job(
+                UsernameIndex.load,
+                trigger=IntervalTrigger(seconds=USERNAME_INDEX_INTERVAL),
+                id="username_index",
+                replace_existing=True,
+            )
+            logger.info(
+                "Username index job added to scheduler with ID 'username_index'."
+            )
 
-        logger.info("Token update job added to scheduler with ID 'token_update'.")
-        return True
+        # Request counts are per worker, so every worker decays its own.
+        if REFRESH_AHEAD_ENABLED:
+            scheduler.add_job(
+                refresh_ahead,
+                trigger=IntervalTrigger(seconds=REFRESH_AHEAD_INTERVAL),
+                id="refresh_ahead",
+                replace_existing=True,
+                max_instances=1,
+            )
+            scheduler.add_job(
+                upstream.decay_hot,
+                trigger=IntervalTrigger(seconds=REFRESH_AHEAD_DECAY_INTERVAL),
+                id="refresh_ahead_decay",
+                replace_existing=True,
+            )
+            logger.info("Refresh-ahead job added to scheduler with ID 'refresh_ahead'.")
+        return test_token
 
     except Exception as e:
         logger.error(f"An error occurred while starting the scheduler: {e}")
@@ -0,0 +1,38 @@
+from utils import panel
+from utils.log import logger
+from utils.leader import is_leader
+from utils.replica import UserReplica
+from utils.config import USER_SYNC_PAGE_SIZE, UVICORN_WORKERS
+
+
+async def user_sync() -> bool:
+    """Reload the local user replica from MARZNESHIN panel.
+
+    Marzneshin's user list cannot be filtered by modification time, so
+    every run reads all pages to pick up revocations and deletions. With
+    several workers only the leader does so; the others load its copy.
+    """
+    try:
+        if UVICORN_WORKERS > 1 and not is_leader():
+            return await UserReplica.load()
+
+        users = {}
+        page, pages = 1, 1
+        while page <= pages:
+            result = await panel.get_users_page(page, USER_SYNC_PAGE_SIZE)
+            if result is None:
+                return False
+
+            users.update((user.username, user) for user in result.items)
+            pages = result.pages
+            page += 1
+
+        UserReplica.replace(users)
+        if UVICORN_WORKERS > 1:
+            await UserReplica.save()
+        logger.debug(f"User replica synced with {len(users)} users.")
+        return True
+
+    except Exception as e:
+        logger.error(f"An unexpected 'USER_SYNC' error occurred: {str(e)}")
+        return False
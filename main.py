@@ -1,8 +1,9 @@
 import logging
 import asyncio
+import socket
+import importlib.util
 import uvicorn
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi import FastAPI, status
 from fastapi.exceptions import RequestValidationError
 from fastapi.routing import APIRoute
 from utils.log import logger
@@ -13,7 +14,11 @@ from fastapi.exception_handlers import (
 from contextlib import asynccontextmanager
 
 from jobs import stop_scheduler, start_scheduler
-from routers import subscription
+from routers import subscription, metrics, admin
+from utils import client, upstream
+from utils.usernames import UsernameIndex
+from utils.snapshots import SnapshotStore
+from utils.middleware import PathExemptCORSMiddleware
 from fastapi_responses import custom_openapi
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from utils.config import (
@@ -22,6 +27,11 @@ from utils.config import (
     UVICORN_UDS,
     UVICORN_SSL_CERTFILE,
     UVICORN_SSL_KEYFILE,
+    UVICORN_WORKERS,
+    PERFORMANCE_PROFILE,
+    METRICS_ENABLED,
+    METRICS_HOST,
+    METRICS_PORT,
     DOCS,
 )
 
@@ -31,10 +41,20 @@ __version__ = "0.1.0"
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application startup and shutdown events."""
+    await client.start_client()
+    await UsernameIndex.load()
+    await SnapshotStore.load()
     await start_scheduler()
+    metrics_server = await start_metrics_server()
     logger.info("Application started successfully.")
     yield  # App will be running during this period
     await stop_scheduler()
+    if metrics_server:
+        server, server_task = metrics_server
+        server.should_exit = True
+        await server_task
+    await upstream.drain()
+    await client.close_client()
     logger.info("Application shut down successfully.")
 
 
@@ -52,7 +72,8 @@ def create_app() -> FastAPI:
     app.openapi = custom_openapi(app)
 
     app.add_middleware(
-        CORSMiddleware,
+        PathExemptCORSMiddleware,
+        exempt_prefix=subscription.router.prefix if PERFORMANCE_PROFILE else None,
         allow_origins=["*"],
         allow_credentials=True,
         allow_methods=["*"],
@@ -61,7 +82,9 @@ def create_app() -> FastAPI:
 
     @app.exception_handler(StarletteHTTPException)
     async def custom_http_exception_handler(request, exc):
-        logger.error(f"An HTTP error!: {repr(exc)}")
+        # Rate-limited requests are meant to be cheap, so they are not logged.
+        if exc.status_code != status.HTTP_429_TOO_MANY_REQUESTS:
+            logger.error(f"An HTTP error!: {repr(exc)}")
         return await http_exception_handler(request, exc)
 
     @app.exception_handler(RequestValidationError)
@@ -75,10 +98,54 @@ def create_app() -> FastAPI:
 
     # Include the router
     app.include_router(subscription.router)
+    app.include_router(admin.router)
+    if METRICS_ENABLED and not METRICS_PORT:
+        app.include_router(metrics.router)
+    if PERFORMANCE_PROFILE:
+        # Matched before the FastAPI routes, so no request parsing or validation.
+        app.router.routes[0:0] = subscription.raw_routes
 
     return app
 
 
+async def start_metrics_server() -> tuple[uvicorn.Server, asyncio.Task] | None:
+    """Serve metrics on METRICS_PORT, if configured, next to the main server."""
+    if not (METRICS_ENABLED and METRICS_PORT):
+        return None
+
+    family = socket.AF_INET6 if ":" in METRICS_HOST else socket.AF_INET
+    try:
+        sock = socket.create_server((METRICS_HOST, METRICS_PORT), family=family)
+    except OSError as e:
+        # With several workers only the first one gets the port.
+        logger.warning(f"Metrics port {METRICS_PORT} unavailable: {e}")
+        return None
+
+    server = uvicorn.Server(
+        uvicorn.Config(
+            metrics.metrics_app, lifespan="off", access_log=False, log_level="warning"
+        )
+    )
+    server_task = asyncio.create_task(server.serve(sockets=[sock]))
+    server_task.add_done_callback(lambda _: sock.close())
+    logger.info(f"Serving metrics on {METRICS_HOST}:{METRICS_PORT}.")
+    return server, server_task
+
+
+def server_options() -> dict:
+    """uvicorn loop/protocol choices for the performance profile."""
+    if not PERFORMANCE_PROFILE:
+        return {}
+
+    options = {}
+    for option, module in (("loop", "uvloop"), ("http", "httptools")):
+        if importlib.util.find_spec(module):
+            options[option] = module
+        else:
+            logger.warning(f"Performance profile: '{module}' is not installed.")
+    return options
+
+
 async def main():
     """Main function to run the application."""
     app = create_app()
@@ -92,14 +159,39 @@ async def main():
         ssl_keyfile=UVICORN_SSL_KEYFILE,
         workers=1,
         log_level=logging.INFO,
+        **server_options(),
     )
     server = uvicorn.Server(config)
     await server.serve()
 
 
+def run_workers():
+    """Run UVICORN_WORKERS pre-forked processes sharing one listening socket."""
+    uvicorn.run(
+        "main:create_app",
+        factory=True,
+        host=UVICORN_HOST,
+        port=UVICORN_PORT,
+        uds=UVICORN_UDS,
+        ssl_certfile=UVICORN_SSL_CERTFILE,
+        ssl_keyfile=UVICORN_SSL_KEYFILE,
+        workers=UVICORN_WORKERS,
+        log_level=logging.INFO,
+        **server_options(),
+    )
+
+
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        if UVICORN_WORKERS > 1:
+            run_workers()
+        else:
+            if server_options().get("loop") == "uvloop":
+                import uvloop
+
+                # uvicorn reuses the running loop here, so the policy must be set first.
+                asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            asyncio.run(main())
     except FileNotFoundError as e:
         logger.error(f"FileNotFoundError: {e}")
     except Exception as e:
@@ -1,2 +1,2 @@
 from .token import TokenData, TokenUpsert, MarzbanToken
-from .marzneshin import UserResponse
+from .marzneshin import UserResponse, UserSnapshot, ReplicaUser, UsersPage
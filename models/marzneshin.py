@@ -23,3 +23,23 @@ class UserResponse(BaseModel):
     traffic_reset_at: datetime | None
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class UserSnapshot(BaseModel):
+    """The subset of a Marzneshin user the subscription handler relies on."""
+
+    sub_revoked_at: datetime | None
+    created_at: datetime
+    subscription_url: str
+
+
+class ReplicaUser(UserSnapshot):
+    username: str
+    enabled: bool
+    is_active: bool
+    activated: bool
+
+
+class UsersPage(BaseModel):
+    items: list[ReplicaUser]
+    pages: int
@@ -16,6 +16,15 @@ class TokenUpsert(BaseModel):
     token: str
 
 
-class MarzbanToken(BaseModel):
-    username: str
-    created_at: datetime | str
+class MarzbanToken:
+    """Claims of a verified Marzban subscription token."""
+
+    __slots__ = ("username", "created_at", "expires_at")
+
+    def __init__(
+        self, username: str, created_at: datetime, expires_at: float | None = None
+    ):
+        self.username = username
+        self.created_at = created_at
+        # Unix time after which the token stops verifying, if it expires.
+        self.expires_at = expires_at
@@ -0,0 +1,77 @@
+import hmac
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+from utils import profiler, tracing
+from utils.config import ADMIN_TOKEN, PROFILE_MAX_SECONDS
+
+
+def require_admin(request: Request) -> None:
+    """Accept only requests carrying `Authorization: Bearer <ADMIN_TOKEN>`."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    scheme, _, credentials = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(
+        credentials.encode(), ADMIN_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+router = APIRouter(
+    prefix="/admin", dependencies=[Depends(require_admin)], include_in_schema=False
+)
+
+
+@router.get("/traces")
+async def get_traces(
+    limit: int = Query(100, ge=1, le=10000), slow_only: bool = False
+) -> list[dict]:
+    """Recent sampled and slow request traces, newest first."""
+    return tracing.recent(limit, slow_only=slow_only)
+
+
+def _folded(stacks: str, **headers: str) -> PlainTextResponse:
+    return PlainTextResponse(
+        stacks,
+        headers={
+            "Content-Disposition": 'attachment; filename="profile.folded"',
+            **headers,
+        },
+    )
+
+
+@router.post("/profile")
+async def profile(
+    seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+    interval: float = Query(0.005, ge=0.0001, le=1),
+    engine: Literal["auto", "sampler", "pyinstrument"] = "auto",
+) -> PlainTextResponse:
+    """Profile this worker's event loop for `seconds`, as collapsed stacks."""
+    if engine == "auto":
+        engine = "pyinstrument" if profiler.pyinstrument else "sampler"
+    elif engine == "pyinstrument" and not profiler.pyinstrument:
+        raise HTTPException(status_code=400, detail="pyinstrument is not installed")
+
+    try:
+        stacks = await profiler.profile_loop(seconds, interval, engine)
+    except profiler.ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return _folded(stacks, **{"X-Profile-Engine": engine})
+
+
+@router.post("/profile/requests")
+async def profile_requests(
+    count: int = Query(10, ge=1, le=10000),
+    rate: float = Query(0.1, gt=0, le=1),
+    interval: float = Query(0.001, ge=0.0001, le=1),
+    timeout: float = Query(60, gt=0, le=PROFILE_MAX_SECONDS),
+) -> PlainTextResponse:
+    """Profile `count` subscription requests, each picked with probability `rate`."""
+    try:
+        stacks, profiled = await profiler.profile_requests(
+            count, rate, interval, timeout
+        )
+    except profiler.ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return _folded(stacks, **{"X-Profiled-Requests": str(profiled)})
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from routers.admin import require_admin
+from utils import metrics
+from utils.config import METRICS_PATH
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
+
+
+route = Route(METRICS_PATH, metrics_endpoint, include_in_schema=False)
+
+# Served on METRICS_PORT, away from the public subscription listener.
+metrics_app = Starlette(routes=[route])
+
+# Without a METRICS_PORT, metrics share the public port and need the admin token.
+router = APIRouter(dependencies=[Depends(require_admin)], include_in_schema=False)
+router.add_api_route(METRICS_PATH, metrics_endpoint, methods=["GET"])
@@ -1,28 +1,174 @@
-import httpx
+import asyncio
+import math
+import os
 import re
-import hashlib
+from typing import BinaryIO
+from urllib.parse import urlsplit, urlunsplit
+import httpx
 
 from fastapi import APIRouter, HTTPException, status, Request, Response
+from fastapi.responses import (
+    FileResponse,
+    JSONResponse,
+    RedirectResponse,
+    StreamingResponse,
+)
+from starlette.routing import Route
+from starlette.types import Receive, Scope, Send
 from utils.log import logger
-from utils import auth, panel
-from utils.config import MARZBAN_XRAY_SUBSCRIPTION_PATH
+from utils import auth, metrics, panel, profiler, upstream
+from utils.tracing import Stage, Trace
+from utils.usernames import UsernameIndex
+from utils.replica import UserReplica
+from utils.snapshots import Snapshot, SnapshotStore
+from utils.breaker import CircuitOpenError
+from utils.admission import OverloadedError
+from utils.ratelimit import TokenBuckets
+from utils.config import (
+    MARZBAN_XRAY_SUBSCRIPTION_PATH,
+    SUB_STREAMING,
+    SUB_REDIRECT_STATUS,
+    SUB_REDIRECT_MAX_AGE,
+    SUB_PROXY_USER_AGENTS,
+    BREAKER_RESET_TIMEOUT,
+    RATE_LIMIT_TOKEN_RATE,
+    RATE_LIMIT_TOKEN_BURST,
+    RATE_LIMIT_IP_RATE,
+    RATE_LIMIT_IP_BURST,
+    RATE_LIMIT_MAX_KEYS,
+    SERVER_TIMING,
+)
+
+_PROXY_USER_AGENTS = (
+    re.compile(SUB_PROXY_USER_AGENTS) if SUB_PROXY_USER_AGENTS else None
+)
+
+_token_limits = TokenBuckets(
+    RATE_LIMIT_TOKEN_RATE, RATE_LIMIT_TOKEN_BURST, RATE_LIMIT_MAX_KEYS
+)
+_ip_limits = TokenBuckets(RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST, RATE_LIMIT_MAX_KEYS)
+
+_VERIFY = Stage("token_verify")
+_USERNAME = Stage("username_translation")
+_USER_LOOKUP = Stage("user_lookup")
+_UPSTREAM_FETCH = Stage("upstream_fetch")
+_RESPONSE_BUILD = Stage("response_build")
 
 router = APIRouter(tags=["Subscription"], prefix=f"/{MARZBAN_XRAY_SUBSCRIPTION_PATH}")
 
 
 @router.get("/{token}/")
 @router.get("/{token}", include_in_schema=False)
+@router.head("/{token}/", include_in_schema=False)
+@router.head("/{token}", include_in_schema=False)
 async def upsert_user(request: Request, token: str):
-    sub = auth.get_subscription_payload(token=token)
+    return await handle_subscription(request, token)
+
+
+async def raw_upsert_user(request: Request) -> Response:
+    """`upsert_user` as a bare Starlette endpoint, used by the performance profile."""
+    try:
+        return await handle_subscription(request, request.path_params["token"])
+    except HTTPException as exc:
+        if exc.status_code != status.HTTP_429_TOO_MANY_REQUESTS:
+            logger.error(f"An HTTP error!: {repr(exc)}")
+        return JSONResponse(
+            {"detail": exc.detail}, status_code=exc.status_code, headers=exc.headers
+        )
+
+
+raw_routes = [
+    Route(
+        f"{router.prefix}/{{token}}",
+        raw_upsert_user,
+        methods=["GET"],
+        include_in_schema=False,
+    ),
+    Route(
+        f"{router.prefix}/{{token}}/",
+        raw_upsert_user,
+        methods=["GET"],
+        include_in_schema=False,
+    ),
+]
+
+
+def _unavailable(retry_after: float = BREAKER_RESET_TIMEOUT) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Upstream panel is temporarily unavailable",
+        headers={"Retry-After": str(max(int(retry_after), 1))},
+    )
+
+
+def _with_query(url: str, query: str) -> str:
+    """Append the client's query string to `url`, keeping any query it has."""
+    if not query:
+        return url
+    parts = urlsplit(url)
+    return urlunsplit(
+        parts._replace(query=f"{parts.query}&{query}" if parts.query else query)
+    )
+
+
+def _check_rate_limits(request: Request, token: str) -> None:
+    """Reject clients over their request rate before any verification work."""
+    wait = 0.0
+    if _ip_limits.enabled and request.client:
+        wait = _ip_limits.acquire(request.client.host)
+    # Malformed tokens are rejected without verification and would only
+    # crowd real ones out of the map.
+    if not wait and _token_limits.enabled and auth.well_formed(token):
+        wait = _token_limits.acquire(token)
+    if wait:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+
+
+async def handle_subscription(request: Request, token: str) -> Response:
+    trace = Trace()
+    try:
+        with profiler.request_profile():
+            response = await _handle_subscription(request, token, trace)
+    except HTTPException as exc:
+        metrics.REQUESTS.inc(str(exc.status_code))
+        total = trace.finish(exc.status_code)
+        if SERVER_TIMING:
+            exc.headers = {
+                **(exc.headers or {}),
+                "Server-Timing": trace.server_timing(total),
+            }
+        raise
+
+    metrics.REQUESTS.inc(str(response.status_code))
+    total = trace.finish(response.status_code)
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = trace.server_timing(total)
+    return response
+
+
+async def _handle_subscription(request: Request, token: str, trace: Trace) -> Response:
+    _check_rate_limits(request, token)
+    with trace.span(_VERIFY):
+        sub = auth.get_subscription_payload(token=token)
     if not sub:
         raise HTTPException(status_code=400, detail="Invalid subscription token")
 
-    username = sub.username
-    clean = re.sub(r"[^\w]", "", username.lower())
-    hash_str = str(int(hashlib.md5(username.encode()).hexdigest(), 16) % 10000).zfill(4)
-    username = f"{clean}_{hash_str}"[:32]
-
-    dbuser = await panel.get_user(username)
+    trace.attributes["username"] = sub.username
+    with trace.span(_USERNAME):
+        username = UsernameIndex.resolve(sub.username)
+    try:
+        with trace.span(_USER_LOOKUP):
+            dbuser = UserReplica.get(username) or await panel.get_user_snapshot(
+                username
+            )
+    except CircuitOpenError:
+        raise _unavailable()
+    except OverloadedError:
+        raise _unavailable(retry_after=1)
     if not dbuser or dbuser.created_at > sub.created_at:
         raise HTTPException(
             status_code=404, detail="User not found or invalid creation date"
@@ -38,24 +184,51 @@ async def upsert_user(request: Request, token: str):
                 status_code=404, detail="Subscription URL not found for user"
             )
 
-        headers = dict(request.headers)
-        headers.pop("host", None)
-        params = dict(request.query_params)
-
-        async with httpx.AsyncClient(follow_redirects=True) as client:
-            response = await client.get(
-                f"{dbuser.subscription_url}",
-                headers=headers,
-                params=params,
+        if SUB_REDIRECT_STATUS and not (
+            _PROXY_USER_AGENTS
+            and _PROXY_USER_AGENTS.search(request.headers.get("user-agent", ""))
+        ):
+            return RedirectResponse(
+                _with_query(dbuser.subscription_url, request.url.query),
+                status_code=SUB_REDIRECT_STATUS,
+                headers={"Cache-Control": f"private, max-age={SUB_REDIRECT_MAX_AGE}"},
             )
 
-            return Response(
-                content=response.content,
-                status_code=response.status_code,
-                headers=dict(response.headers),
-                media_type=response.headers.get("content-type", "text/plain"),
+        headers = upstream.filter_headers(request.headers, exclude=("host",))
+        params = request.query_params.multi_items()
+
+        # HEAD has no body to relay, so it is answered from the cached path.
+        if SUB_STREAMING and request.method != "HEAD":
+            with trace.span(_UPSTREAM_FETCH):
+                response = await upstream.open_subscription_stream(
+                    dbuser.subscription_url, headers=headers, params=params
+                )
+            return _RelayResponse(response)
+
+        with trace.span(_UPSTREAM_FETCH):
+            response = await upstream.fetch_subscription(
+                dbuser.subscription_url, headers=headers, params=params
             )
+        with trace.span(_RESPONSE_BUILD):
+            built = await _build_response(request, response)
+        if built is None:
+            # The snapshot was replaced or evicted since the lookup; look again.
+            with trace.span(_UPSTREAM_FETCH):
+                response = await upstream.fetch_subscription(
+                    dbuser.subscription_url, headers=headers, params=params
+                )
+            with trace.span(_RESPONSE_BUILD):
+                built = await _build_response(request, response)
+            if built is None:
+                raise _unavailable(retry_after=1)
+        return built
 
+    except HTTPException:
+        raise
+    except CircuitOpenError:
+        raise _unavailable()
+    except OverloadedError:
+        raise _unavailable(retry_after=1)
     except httpx.RequestError as e:
         logger.error(f"Error forwarding subscription request: {str(e)}")
         raise HTTPException(
@@ -68,3 +241,121 @@ async def upsert_user(request: Request, token: str):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error",
         )
+
+
+async def _build_response(
+    request: Request, response: upstream.CachedSubscription | Snapshot
+) -> Response | None:
+    """Negotiate the encoding and answer from the cached subscription.
+
+    Returns None if a snapshot's file is gone before it could be opened.
+    """
+    encoding, response_headers = upstream.representation(
+        response, request.headers.get("accept-encoding")
+    )
+    if response.status_code == 200 and upstream.not_modified(
+        request.headers, response_headers
+    ):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers=upstream.not_modified_headers(response_headers),
+        )
+
+    if response.path:
+        try:
+            file, stat_result = await response.open(encoding)
+        except FileNotFoundError:
+            SnapshotStore.discard(response.digest)
+            return None
+        return _SnapshotFileResponse(
+            file,
+            stat_result,
+            status_code=response.status_code,
+            headers=response_headers,
+            media_type=response.media_type,
+        )
+
+    body = response.body(encoding)
+    if request.method == "HEAD":
+        return Response(
+            status_code=response.status_code,
+            headers={**response_headers, "content-length": str(len(body))},
+            media_type=response.media_type,
+        )
+
+    return Response(
+        content=body,
+        status_code=response.status_code,
+        headers=response_headers,
+        media_type=response.media_type,
+    )
+
+
+class _RelayResponse(StreamingResponse):
+    """Relay a streamed upstream body, releasing its connection however sending ends.
+
+    The body iterator's own cleanup only runs once iteration starts, which
+    a client disconnecting before the first chunk would skip.
+    """
+
+    def __init__(self, response: httpx.Response):
+        self.upstream = response
+        super().__init__(
+            upstream.iter_raw(response),
+            status_code=response.status_code,
+            headers=upstream.filter_headers(response.headers),
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.upstream.aclose()
+
+
+class _SnapshotFileResponse(FileResponse):
+    """FileResponse for a snapshot file opened before the response was built.
+
+    Uses the server's zero-copy send when it offers one, and otherwise
+    reads in large chunks to keep thread hops few.
+    """
+
+    chunk_size = 1024 * 1024
+
+    def __init__(self, file: BinaryIO, stat_result: os.stat_result, **kwargs):
+        self.file = file
+        super().__init__(file.name, stat_result=stat_result, **kwargs)
+
+    def set_stat_headers(self, stat_result: os.stat_result) -> None:
+        # Validators come from the upstream, the same as for bodies in memory.
+        self.headers.setdefault("content-length", str(stat_result.st_size))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": self.status_code,
+                    "headers": self.raw_headers,
+                }
+            )
+            if scope["method"].upper() == "HEAD":
+                await send({"type": "http.response.body", "body": b""})
+            elif "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopysend", "file": self.file})
+            else:
+                more_body = True
+                while more_body:
+                    chunk = await asyncio.to_thread(self.file.read, self.chunk_size)
+                    more_body = len(chunk) == self.chunk_size
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": chunk,
+                            "more_body": more_body,
+                        }
+                    )
+        finally:
+            self.file.close()
+        if self.background is not None:
+            await self.background()
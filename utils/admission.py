@@ -0,0 +1,67 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from utils import metrics
+from utils.config import (
+    ADMISSION_MAX_INFLIGHT,
+    ADMISSION_QUEUE_SIZE,
+    ADMISSION_QUEUE_TIMEOUT,
+)
+
+
+class OverloadedError(Exception):
+    """Raised when no upstream request slot frees up in time."""
+
+
+class AdmissionGate:
+    """Cap concurrent upstream requests, with a bounded queue of waiters."""
+
+    def __init__(self, limit: int, queue_size: int, timeout: float):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.waiting = 0
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(max(limit, 1))
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        if self.limit <= 0:
+            yield
+            return
+
+        if self._semaphore.locked():
+            if self.waiting >= self.queue_size:
+                raise OverloadedError("Upstream request queue is full")
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                raise OverloadedError("Timed out waiting for an upstream slot")
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+
+upstream_gate = AdmissionGate(
+    ADMISSION_MAX_INFLIGHT, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT
+)
+
+metrics.CallbackMetric(
+    "upstream_requests_in_flight",
+    "Requests to Marzneshin currently holding an admission slot.",
+    lambda: upstream_gate.in_flight,
+)
+metrics.CallbackMetric(
+    "upstream_requests_waiting",
+    "Requests to Marzneshin queued for an admission slot.",
+    lambda: upstream_gate.waiting,
+)
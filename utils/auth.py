@@ -1,52 +1,131 @@
+import hmac
+import json
+import re
+import time
 from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
 from datetime import datetime
 from hashlib import sha256
-from typing import Union, Dict
-from utils.config import MARZBAN_JWT_TOKEN
-from jose import JWTError, jwt
+from typing import Union
+from utils.config import (
+    MARZBAN_JWT_TOKEN,
+    AUTH_CACHE_SIZE,
+    AUTH_NEGATIVE_CACHE_SIZE,
+)
+from utils.cache import TTLCache, MISSING
+from utils import metrics
 from models import MarzbanToken
 
+_KEY = MARZBAN_JWT_TOKEN.encode("utf-8")
+_JWT_HMAC = hmac.new(_KEY, digestmod=sha256)
+_JWT_HEADER = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9."
+_JWT_PATTERN = re.compile(r"[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]{43}")
+_LEGACY_PATTERN = re.compile(r"[A-Za-z0-9_-]{15,}")
+_MAX_TOKEN_LENGTH = 2048
+
+_verified = TTLCache(maxsize=AUTH_CACHE_SIZE)
+_rejected = TTLCache(maxsize=AUTH_NEGATIVE_CACHE_SIZE)
+metrics.watch_cache("auth", lambda: len(_verified), lambda: _verified.evictions)
+
 
 def get_subscription_payload(
     token: str,
 ) -> Union[MarzbanToken, None]:
+    cached = _verified.get(token)
+    if cached is not MISSING:
+        metrics.CACHE_EVENTS.inc("auth", "hit")
+        return cached
+
+    if _rejected.get(token) is not MISSING:
+        metrics.CACHE_EVENTS.inc("auth", "rejected")
+        return None
+
+    metrics.CACHE_EVENTS.inc("auth", "miss")
+    payload = _verify_token(token)
+    if payload:
+        # An expiring JWT must stop verifying once it expires.
+        ttl = None
+        if payload.expires_at is not None:
+            ttl = payload.expires_at - time.time()
+        _verified.set(token, payload, ttl=ttl)
+    else:
+        _rejected.set(token, True)
+    return payload
+
+
+def _b64url_decode(data: str) -> bytes:
+    return b64decode(data + "=" * (-len(data) % 4), altchars=b"-_", validate=True)
+
+
+def well_formed(token: str) -> bool:
+    """Cheap shape check; a token failing it can never verify."""
+    if len(token) < 15 or len(token) > _MAX_TOKEN_LENGTH:
+        return False
+    if token.startswith(_JWT_HEADER):
+        return _JWT_PATTERN.fullmatch(token) is not None
+    return _LEGACY_PATTERN.fullmatch(token) is not None
+
+
+def _verify_token(
+    token: str,
+) -> Union[MarzbanToken, None]:
+    if not well_formed(token):
+        return None
+    if token.startswith(_JWT_HEADER):
+        return _verify_jwt(token)
+    return _verify_legacy(token)
+
+
+def _verify_jwt(token: str) -> Union[MarzbanToken, None]:
+    """Check an HS256 Marzban subscription JWT without a generic JOSE stack."""
+    signing_input, _, signature = token.rpartition(".")
+
+    mac = _JWT_HMAC.copy()
+    mac.update(signing_input.encode("ascii"))
     try:
-        if len(token) < 15:
+        if not hmac.compare_digest(mac.digest(), _b64url_decode(signature)):
             return None
+        payload = json.loads(_b64url_decode(signing_input[len(_JWT_HEADER) :]))
+    except (BinasciiError, ValueError):
+        return None
+
+    if not isinstance(payload, dict) or payload.get("access") != "subscription":
+        return None
 
-        if token.startswith("eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9."):
-            payload = jwt.decode(token, MARZBAN_JWT_TOKEN, algorithms=["HS256"])
-            if payload.get("access") == "subscription":
-                return MarzbanToken(
-                    username=payload["sub"],
-                    created_at=datetime.utcfromtimestamp(payload["iat"]),
-                )
-            else:
-                return None
-        else:
-            u_token, u_signature = token[:-10], token[-10:]
-            try:
-                u_token_dec = b64decode(
-                    u_token.encode("utf-8")
-                    + b"=" * (-len(u_token.encode("utf-8")) % 4),
-                    altchars=b"-_",
-                    validate=True,
-                ).decode("utf-8")
-            except:
-                return None
-
-            u_token_resign = b64encode(
-                sha256((u_token + MARZBAN_JWT_TOKEN).encode("utf-8")).digest(),
-                altchars=b"-_",
-            ).decode("utf-8")[:10]
-
-            if u_signature == u_token_resign:
-                u_username, u_created_at = u_token_dec.split(",")
-                return MarzbanToken(
-                    username=u_username,
-                    created_at=datetime.utcfromtimestamp(int(u_created_at)),
-                )
-            else:
-                return None
-    except JWTError:
+    username, issued_at, expires_at = (
+        payload.get("sub"),
+        payload.get("iat"),
+        payload.get("exp"),
+    )
+    if not isinstance(username, str) or not isinstance(issued_at, (int, float)):
+        return None
+    if expires_at is not None and (
+        not isinstance(expires_at, (int, float)) or expires_at <= time.time()
+    ):
+        return None
+
+    try:
+        created_at = datetime.utcfromtimestamp(issued_at)
+    except (ValueError, OverflowError, OSError):
+        return None
+    return MarzbanToken(username=username, created_at=created_at, expires_at=expires_at)
+
+
+def _verify_legacy(token: str) -> Union[MarzbanToken, None]:
+    """Check a legacy `<base64 "username,created_at"><10-char signature>` token."""
+    u_token, u_signature = token[:-10], token[-10:]
+
+    u_token_resign = b64encode(
+        sha256(u_token.encode("ascii") + _KEY).digest(), altchars=b"-_"
+    )[:10]
+    if not hmac.compare_digest(u_signature.encode("ascii"), u_token_resign):
+        return None
+
+    try:
+        u_username, u_created_at = _b64url_decode(u_token).decode("utf-8").split(",")
+        return MarzbanToken(
+            username=u_username,
+            created_at=datetime.utcfromtimestamp(int(u_created_at)),
+        )
+    except (BinasciiError, ValueError, OverflowError, OSError):
         return None
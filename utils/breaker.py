@@ -0,0 +1,95 @@
+import time
+from typing import Callable
+from urllib.parse import urlsplit
+from utils.log import logger
+from utils import metrics
+from utils.config import BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT
+
+_recovery_listeners: list[Callable[[str], None]] = []
+
+
+def on_recovery(listener: Callable[[str], None]) -> Callable[[str], None]:
+    """Register `listener(host)` to run whenever a circuit closes again."""
+    _recovery_listeners.append(listener)
+    return listener
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+class CircuitBreaker:
+    """Stop calling an upstream after repeated failures.
+
+    After `threshold` consecutive failures the circuit opens and calls are
+    refused for `reset_timeout` seconds. Then a single probe is let through:
+    success closes the circuit, failure keeps it open for another period.
+    """
+
+    def __init__(self, name: str, threshold: int, reset_timeout: float):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+
+        now = time.monotonic()
+        if now - self.opened_at < self.reset_timeout:
+            return False
+        # Half-open: let this call probe and refuse others for another period.
+        self.opened_at = now
+        return True
+
+    def check(self) -> None:
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit for {self.name} is open")
+
+    def record_success(self) -> bool:
+        """Close the circuit; returns True when it was open before."""
+        recovered = self.opened_at is not None
+        self.failures = 0
+        self.opened_at = None
+        if recovered:
+            logger.info(f"Circuit for {self.name} closed, upstream recovered.")
+            for listener in _recovery_listeners:
+                listener(self.name)
+        return recovered
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.threshold:
+            if self.opened_at is None:
+                logger.error(
+                    f"Circuit for {self.name} opened after {self.failures} failures."
+                )
+            self.opened_at = time.monotonic()
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(url: str) -> CircuitBreaker:
+    """The shared breaker for the host serving `url`."""
+    host = urlsplit(url).netloc
+    breaker = _breakers.get(host)
+    if breaker is None:
+        breaker = _breakers[host] = CircuitBreaker(
+            host, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT
+        )
+    return breaker
+
+
+metrics.CallbackMetric(
+    "circuit_open",
+    "Whether requests to an upstream host are being skipped.",
+    lambda: {(host,): int(b.is_open) for host, b in _breakers.items()},
+    labelnames=("host",),
+)
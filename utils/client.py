@@ -0,0 +1,154 @@
+import asyncio
+import httpx
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from utils.log import logger
+from utils import metrics
+from utils.config import (
+    MARZNESHIN_ADDRESS,
+    HTTP_HTTP2,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    HTTP_POOL_TIMEOUT,
+    HTTP_WARMUP_CONNECTIONS,
+)
+
+_client: httpx.AsyncClient | None = None
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, transport: "_CountingTransport"):
+        self._stream = stream
+        self._transport = transport
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._transport.active -= 1
+
+
+class _CountingTransport(httpx.AsyncBaseTransport):
+    """Count requests holding an upstream connection, until their body is closed.
+
+    Wraps the real transport through httpx's public transport API, so the
+    count does not depend on the connection pool's internals.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+        self.active = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.active += 1
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self.active -= 1
+            raise
+        response.stream = _ReleasingStream(response.stream, self)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+_transport: _CountingTransport | None = None
+
+
+def _http2_available() -> bool:
+    if not HTTP_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning(
+            "HTTP_HTTP2 is enabled but the 'h2' package is not installed, using HTTP/1.1."
+        )
+        return False
+    return True
+
+
+def _build_client() -> httpx.AsyncClient:
+    global _transport
+    _transport = _CountingTransport(
+        httpx.AsyncHTTPTransport(
+            http2=_http2_available(),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+    )
+    return httpx.AsyncClient(
+        transport=_transport,
+        timeout=httpx.Timeout(
+            HTTP_READ_TIMEOUT,
+            connect=HTTP_CONNECT_TIMEOUT,
+            pool=HTTP_POOL_TIMEOUT,
+        ),
+        # The client is shared by every subscriber, so upstream cookies must never stick.
+        cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+    )
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the process-wide upstream client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+metrics.CallbackMetric(
+    "http_pool_active_requests",
+    "Upstream requests holding a connection of the shared client.",
+    lambda: _transport.active if _transport is not None else 0,
+)
+metrics.CallbackMetric(
+    "http_pool_max_connections",
+    "Upper bound on connections held by the shared upstream client.",
+    lambda: HTTP_MAX_CONNECTIONS,
+)
+
+
+async def _warm_up(client: httpx.AsyncClient) -> None:
+    """Open keep-alive connections to Marzneshin before the first request arrives."""
+    if HTTP_WARMUP_CONNECTIONS <= 0:
+        return
+
+    results = await asyncio.gather(
+        *(
+            client.head(MARZNESHIN_ADDRESS)
+            for _ in range(min(HTTP_WARMUP_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS))
+        ),
+        return_exceptions=True,
+    )
+    failed = [r for r in results if isinstance(r, Exception)]
+    if failed:
+        logger.warning(f"Connection warm-up failed: {repr(failed[0])}")
+    else:
+        logger.info(f"Warmed up {len(results)} upstream connections.")
+
+
+async def start_client() -> httpx.AsyncClient:
+    client = get_client()
+    await _warm_up(client)
+    return client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,75 @@
+import gzip
+from typing import Callable, Iterable
+from utils.log import logger
+from utils.config import SUB_COMPRESSION_ENCODINGS
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _compressors() -> dict[str, Callable[[bytes], bytes]]:
+    available = {"gzip": lambda data: gzip.compress(data, compresslevel=6, mtime=0)}
+    if brotli is not None:
+        available["br"] = lambda data: brotli.compress(
+            data, mode=brotli.MODE_TEXT, quality=5
+        )
+    if zstandard is not None:
+        available["zstd"] = zstandard.ZstdCompressor(level=3).compress
+
+    compressors = {}
+    for encoding in SUB_COMPRESSION_ENCODINGS:
+        if encoding in available:
+            compressors[encoding] = available[encoding]
+        else:
+            logger.warning(
+                f"Compression '{encoding}' is not available, install its package to enable it."
+            )
+    return compressors
+
+
+# Ordered by preference, used to break ties between equally acceptable encodings.
+COMPRESSORS = _compressors()
+
+
+def compress_all(data: bytes) -> dict[str, bytes]:
+    """Compress `data` with every enabled encoding, keeping only smaller results."""
+    variants = {}
+    for encoding, compress in COMPRESSORS.items():
+        compressed = compress(data)
+        if len(compressed) < len(data):
+            variants[encoding] = compressed
+    return variants
+
+
+def negotiate(accept_encoding: str | None, available: Iterable[str]) -> str | None:
+    """Pick the encoding the client prefers among `available`, None for identity."""
+    if not accept_encoding:
+        return None
+
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+
+    default = weights.get("*", 0.0)
+    best, best_weight = None, 0.0
+    for encoding in available:
+        weight = weights.get(encoding, default)
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
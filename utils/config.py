@@ -1,4 +1,4 @@
-from decouple import config
+from decouple import config, Choices, Csv
 import re
 
 
@@ -38,6 +38,9 @@ UVICORN_PORT = config("UVICORN_PORT", cast=int, default=999)
 UVICORN_UDS = config("UVICORN_UDS", default=None)
 UVICORN_SSL_CERTFILE = config("UVICORN_SSL_CERTFILE", default=None)
 UVICORN_SSL_KEYFILE = config("UVICORN_SSL_KEYFILE", default=None)
+UVICORN_WORKERS = config("UVICORN_WORKERS", default=1, cast=int)
+LEADER_LOCK_FILE = config("LEADER_LOCK_FILE", default="scheduler.lock")
+PERFORMANCE_PROFILE = config("PERFORMANCE_PROFILE", default=False, cast=bool)
 DOCS = config("DOCS", default=True, cast=bool)
 DEBUG = config("DEBUG", default=False, cast=bool)
 
@@ -49,3 +52,120 @@ MARZBAN_JWT_TOKEN = config("MARZBAN_JWT_TOKEN", default="", cast=str)
 MARZBAN_XRAY_SUBSCRIPTION_PATH = config(
     "MARZBAN_XRAY_SUBSCRIPTION_PATH", default="", cast=str
 )
+# How often imported usernames are reloaded from the database, 0 disables
+USERNAME_INDEX_INTERVAL = config("USERNAME_INDEX_INTERVAL", default=300.0, cast=float)
+
+# Upstream HTTP client settings
+HTTP_HTTP2 = config("HTTP_HTTP2", default=False, cast=bool)
+HTTP_MAX_CONNECTIONS = config("HTTP_MAX_CONNECTIONS", default=100, cast=int)
+HTTP_MAX_KEEPALIVE_CONNECTIONS = config(
+    "HTTP_MAX_KEEPALIVE_CONNECTIONS", default=20, cast=int
+)
+HTTP_KEEPALIVE_EXPIRY = config("HTTP_KEEPALIVE_EXPIRY", default=60.0, cast=float)
+HTTP_CONNECT_TIMEOUT = config("HTTP_CONNECT_TIMEOUT", default=5.0, cast=float)
+HTTP_READ_TIMEOUT = config("HTTP_READ_TIMEOUT", default=15.0, cast=float)
+HTTP_POOL_TIMEOUT = config("HTTP_POOL_TIMEOUT", default=5.0, cast=float)
+HTTP_WARMUP_CONNECTIONS = config("HTTP_WARMUP_CONNECTIONS", default=2, cast=int)
+
+# Marzneshin user lookup cache
+USER_CACHE_SIZE = config("USER_CACHE_SIZE", default=10000, cast=int)
+USER_CACHE_TTL = config("USER_CACHE_TTL", default=60.0, cast=float)
+USER_CACHE_NEGATIVE_TTL = config("USER_CACHE_NEGATIVE_TTL", default=15.0, cast=float)
+
+# Subscription body cache
+SUB_CACHE_TTL = config("SUB_CACHE_TTL", default=60.0, cast=float)
+SUB_CACHE_MAX_BYTES = config("SUB_CACHE_MAX_BYTES", default=64 * 1024 * 1024, cast=int)
+SUB_COMPRESSION_ENCODINGS = config(
+    "SUB_COMPRESSION_ENCODINGS", default="br,zstd,gzip", cast=Csv()
+)
+SUB_COMPRESSION_MIN_SIZE = config("SUB_COMPRESSION_MIN_SIZE", default=512, cast=int)
+SUB_DISK_CACHE_DIR = config("SUB_DISK_CACHE_DIR", default="", cast=str)
+SUB_DISK_CACHE_MAX_BYTES = config(
+    "SUB_DISK_CACHE_MAX_BYTES", default=1024 * 1024 * 1024, cast=int
+)
+SUB_STREAMING = config("SUB_STREAMING", default=False, cast=bool)
+
+# Subscription token verification cache
+AUTH_CACHE_SIZE = config("AUTH_CACHE_SIZE", default=10000, cast=int)
+AUTH_NEGATIVE_CACHE_SIZE = config("AUTH_NEGATIVE_CACHE_SIZE", default=1000, cast=int)
+
+# Marzneshin admin token refresh
+TOKEN_REFRESH_INTERVAL = config("TOKEN_REFRESH_INTERVAL", default=8 * 3600, cast=float)
+TOKEN_REFRESH_MARGIN = config("TOKEN_REFRESH_MARGIN", default=600.0, cast=float)
+TOKEN_REFRESH_JITTER = config("TOKEN_REFRESH_JITTER", default=300.0, cast=float)
+TOKEN_RETRY_INTERVAL = config("TOKEN_RETRY_INTERVAL", default=60.0, cast=float)
+TOKEN_SYNC_INTERVAL = config("TOKEN_SYNC_INTERVAL", default=60.0, cast=float)
+
+# Local user replica
+USER_SYNC_ENABLED = config("USER_SYNC_ENABLED", default=False, cast=bool)
+USER_SYNC_INTERVAL = config("USER_SYNC_INTERVAL", default=60.0, cast=float)
+USER_SYNC_PAGE_SIZE = config("USER_SYNC_PAGE_SIZE", default=500, cast=int)
+
+# Redirect mode: 0 proxies every body, otherwise answer with this redirect status
+SUB_REDIRECT_STATUS = int(
+    config(
+        "SUB_REDIRECT_STATUS",
+        default="0",
+        cast=Choices(["0", "301", "302", "307", "308"]),
+    )
+)
+SUB_REDIRECT_MAX_AGE = config("SUB_REDIRECT_MAX_AGE", default=300, cast=int)
+SUB_PROXY_USER_AGENTS = config("SUB_PROXY_USER_AGENTS", default="", cast=str)
+
+# Upstream outages
+SUB_CONNECT_TIMEOUT = config("SUB_CONNECT_TIMEOUT", default=3.0, cast=float)
+SUB_READ_TIMEOUT = config("SUB_READ_TIMEOUT", default=10.0, cast=float)
+BREAKER_FAILURE_THRESHOLD = config("BREAKER_FAILURE_THRESHOLD", default=5, cast=int)
+BREAKER_RESET_TIMEOUT = config("BREAKER_RESET_TIMEOUT", default=30.0, cast=float)
+STALE_IF_ERROR = config("STALE_IF_ERROR", default=3600.0, cast=float)
+
+# Admission control and rate limiting
+ADMISSION_MAX_INFLIGHT = config("ADMISSION_MAX_INFLIGHT", default=100, cast=int)
+ADMISSION_QUEUE_SIZE = config("ADMISSION_QUEUE_SIZE", default=200, cast=int)
+ADMISSION_QUEUE_TIMEOUT = config("ADMISSION_QUEUE_TIMEOUT", default=2.0, cast=float)
+RATE_LIMIT_TOKEN_RATE = config("RATE_LIMIT_TOKEN_RATE", default=1.0, cast=float)
+RATE_LIMIT_TOKEN_BURST = config("RATE_LIMIT_TOKEN_BURST", default=20.0, cast=float)
+RATE_LIMIT_IP_RATE = config("RATE_LIMIT_IP_RATE", default=0.0, cast=float)
+RATE_LIMIT_IP_BURST = config("RATE_LIMIT_IP_BURST", default=100.0, cast=float)
+RATE_LIMIT_MAX_KEYS = config("RATE_LIMIT_MAX_KEYS", default=100000, cast=int)
+
+# Prometheus metrics
+METRICS_ENABLED = config("METRICS_ENABLED", default=False, cast=bool)
+METRICS_PATH = config("METRICS_PATH", default="/metrics")
+METRICS_HOST = config("METRICS_HOST", default="127.0.0.1")
+METRICS_PORT = config("METRICS_PORT", default=9464, cast=int)
+
+# Server-Timing and request tracing
+SERVER_TIMING = config("SERVER_TIMING", default=False, cast=bool)
+TRACE_SAMPLE_RATE = config("TRACE_SAMPLE_RATE", default=0.0, cast=float)
+TRACE_SLOW_THRESHOLD = config("TRACE_SLOW_THRESHOLD", default=2.0, cast=float)
+TRACE_EXPORTER = config(
+    "TRACE_EXPORTER", default="memory", cast=Choices(["memory", "file"])
+)
+TRACE_BUFFER_SIZE = config("TRACE_BUFFER_SIZE", default=1000, cast=int)
+TRACE_FILE = config("TRACE_FILE", default="traces.ndjson")
+TRACE_FILE_MAX_BYTES = config(
+    "TRACE_FILE_MAX_BYTES", default=10 * 1024 * 1024, cast=int
+)
+TRACE_FILE_BACKUPS = config("TRACE_FILE_BACKUPS", default=3, cast=int)
+
+# Admin endpoints, disabled while empty
+ADMIN_TOKEN = config("ADMIN_TOKEN", default="")
+PROFILE_MAX_SECONDS = config("PROFILE_MAX_SECONDS", default=120.0, cast=float)
+
+# Logging
+LOG_JSON = config("LOG_JSON", default=False, cast=bool)
+LOG_FILE_MAX_BYTES = config("LOG_FILE_MAX_BYTES", default=10 * 1024 * 1024, cast=int)
+LOG_FILE_BACKUPS = config("LOG_FILE_BACKUPS", default=5, cast=int)
+LOG_QUEUE_SIZE = config("LOG_QUEUE_SIZE", default=10000, cast=int)
+LOG_REPEAT_WINDOW = config("LOG_REPEAT_WINDOW", default=10.0, cast=float)
+
+# Refresh-ahead of hot subscriptions
+REFRESH_AHEAD_ENABLED = config("REFRESH_AHEAD_ENABLED", default=False, cast=bool)
+REFRESH_AHEAD_INTERVAL = config("REFRESH_AHEAD_INTERVAL", default=5.0, cast=float)
+REFRESH_AHEAD_WINDOW = config("REFRESH_AHEAD_WINDOW", default=15.0, cast=float)
+REFRESH_AHEAD_TOP_N = config("REFRESH_AHEAD_TOP_N", default=1000, cast=int)
+REFRESH_AHEAD_CONCURRENCY = config("REFRESH_AHEAD_CONCURRENCY", default=4, cast=int)
+REFRESH_AHEAD_DECAY_INTERVAL = config(
+    "REFRESH_AHEAD_DECAY_INTERVAL", default=300.0, cast=float
+)
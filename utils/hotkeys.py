@@ -0,0 +1,78 @@
+from typing import Any, Hashable, Iterator
+
+
+class CountMinSketch:
+    """Approximate per-key counters in fixed memory; estimates never undercount."""
+
+    def __init__(self, width: int = 4096, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self._rows = [[0] * width for _ in range(depth)]
+
+    def add(self, key: Hashable) -> int:
+        """Count one occurrence of `key` and return its new estimate."""
+        estimate = None
+        for seed, row in enumerate(self._rows):
+            index = hash((seed, key)) % self.width
+            row[index] += 1
+            if estimate is None or row[index] < estimate:
+                estimate = row[index]
+        return estimate
+
+    def decay(self) -> None:
+        """Halve every counter so old popularity fades out."""
+        for row in self._rows:
+            for index, count in enumerate(row):
+                if count:
+                    row[index] = count >> 1
+
+
+class HotKeys:
+    """Keep the `size` most requested keys, with the latest value seen for each."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._sketch = CountMinSketch()
+        self._top: dict[Hashable, list] = {}
+        self._floor = 0
+
+    def __len__(self) -> int:
+        return len(self._top)
+
+    def record(self, key: Hashable, value: Any) -> None:
+        count = self._sketch.add(key)
+        entry = self._top.get(key)
+        if entry is not None:
+            entry[0] = count
+            entry[1] = value
+            return
+
+        if len(self._top) < self.size:
+            self._top[key] = [count, value]
+            return
+        if count <= self._floor:
+            return
+
+        coldest = min(self._top, key=lambda k: self._top[k][0])
+        self._floor = self._top[coldest][0]
+        if count > self._floor:
+            del self._top[coldest]
+            self._top[key] = [count, value]
+
+    def items(self) -> Iterator[tuple[Hashable, Any]]:
+        """Yield the tracked keys and values, hottest first."""
+        ranked = sorted(self._top.items(), key=lambda item: item[1][0], reverse=True)
+        for key, (_, value) in ranked:
+            yield key, value
+
+    def decay(self) -> None:
+        """Halve every count and forget keys that were not requested since."""
+        self._sketch.decay()
+        for key, entry in list(self._top.items()):
+            entry[0] >>= 1
+            if not entry[0]:
+                del self._top[key]
+        if len(self._top) < self.size:
+            self._floor = 0
+        else:
+            self._floor = min(entry[0] for entry in self._top.values())
@@ -0,0 +1,30 @@
+import fcntl
+import os
+from utils.config import LEADER_LOCK_FILE
+
+_lock_fd: int | None = None
+
+
+def acquire_leadership() -> bool:
+    """Try to become the worker that runs singleton jobs such as token refresh.
+
+    Leadership is an exclusive flock held until the process exits, so when
+    the leader dies the lock is released and another worker can take over.
+    """
+    global _lock_fd
+    if _lock_fd is not None:
+        return True
+
+    fd = os.open(LEADER_LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return False
+
+    _lock_fd = fd
+    return True
+
+
+def is_leader() -> bool:
+    return _lock_fd is not None
@@ -1,4 +1,114 @@
+import atexit
+import copy
+import json
 import logging
+import queue
+import time
+from datetime import datetime, timezone
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+    WatchedFileHandler,
+)
+from utils.config import (
+    UVICORN_WORKERS,
+    LOG_JSON,
+    LOG_FILE_MAX_BYTES,
+    LOG_FILE_BACKUPS,
+    LOG_QUEUE_SIZE,
+    LOG_REPEAT_WINDOW,
+)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RepeatFilter(logging.Filter):
+    """Pass an identical warning or error once per `window` seconds.
+
+    The next copy let through reports how many were dropped in between.
+    """
+
+    def __init__(self, window: float, max_keys: int = 1024):
+        super().__init__()
+        self.window = window
+        self.max_keys = max_keys
+        self._seen: dict[tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.window <= 0 or record.levelno < logging.WARNING:
+            return True
+
+        key = (record.levelno, record.getMessage())
+        now = time.monotonic()
+        seen = self._seen.get(key)
+        if seen is not None and now - seen[0] < self.window:
+            seen[1] += 1
+            return False
+
+        if seen is not None and seen[1]:
+            record.msg = f"{key[1]} ({seen[1]} repeats suppressed)"
+            record.args = None
+        if len(self._seen) >= self.max_keys:
+            self._seen.clear()
+        self._seen[key] = [now, 0]
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message now, but leave formatting, including any
+        # traceback, to the target handlers' formatters.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def queue_handlers(*handlers: logging.Handler) -> DroppingQueueHandler:
+    """Return a handler that hands records to `handlers` on a background thread."""
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return DroppingQueueHandler(log_queue)
+
+
+def file_handler(path: str, max_bytes: int, backups: int) -> logging.Handler:
+    """Handler appending to `path`, rotated at `max_bytes` by a single worker.
+
+    Several workers would each rotate the shared file and rename it from
+    under the others, so they instead reopen it whenever an external tool
+    such as logrotate moves it.
+    """
+    if UVICORN_WORKERS > 1:
+        return WatchedFileHandler(path)
+    return RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
 
 
 def setup_logger(bot_name, level=logging.INFO):
@@ -8,15 +118,22 @@ def setup_logger(bot_name, level=logging.INFO):
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.DEBUG)
 
-    file_handler = logging.FileHandler(f"{bot_name}.log")
-    file_handler.setLevel(logging.INFO)
+    log_file_handler = file_handler(
+        f"{bot_name}.log", LOG_FILE_MAX_BYTES, LOG_FILE_BACKUPS
+    )
+    log_file_handler.setLevel(logging.INFO)
 
-    formatter = logging.Formatter("%(levelname)-8s | %(message)s")
+    if LOG_JSON:
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(levelname)-8s | %(message)s")
     console_handler.setFormatter(formatter)
-    file_handler.setFormatter(formatter)
+    log_file_handler.setFormatter(formatter)
 
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    # Handlers write from a listener thread, so logging never blocks the event loop.
+    handler = queue_handlers(console_handler, log_file_handler)
+    handler.addFilter(RepeatFilter(LOG_REPEAT_WINDOW))
+    logger.addHandler(handler)
 
     return logger
 
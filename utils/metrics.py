@@ -0,0 +1,202 @@
+"""Minimal Prometheus text-format metrics.
+
+Metrics live in plain dicts and lists mutated from the event loop thread,
+so recording a value takes no lock and costs a few dict operations.
+"""
+
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+_registry: list["_Metric"] = []
+
+# Latency buckets in seconds, from cache hits to slow panel responses.
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        _registry.append(self)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}"]
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class CallbackMetric(_Metric):
+    """A counter or gauge read from `callback` at scrape time.
+
+    The callback returns a number, or a mapping of label tuples to numbers.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], float | dict[tuple, float]],
+        labelnames: tuple = (),
+        kind: str = "gauge",
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def samples(self) -> Iterable[str]:
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._children: dict[tuple, _HistogramChild] = {}
+
+    def labels(self, *labels: str) -> _HistogramChild:
+        """Return the series for `labels`; keep it around on hot paths."""
+        child = self._children.get(labels)
+        if child is None:
+            child = self._children[labels] = _HistogramChild(self.buckets)
+        return child
+
+    def samples(self) -> Iterable[str]:
+        for labels, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), child.counts):
+                cumulative += count
+                label_str = _format_labels((*self.labelnames, "le"), (*labels, bound))
+                yield f"{self.name}_bucket{label_str} {cumulative}"
+            label_str = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_str} {child.sum}"
+            yield f"{self.name}_count{label_str} {cumulative}"
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# Metrics shared across modules; module-specific ones are declared where used.
+REQUESTS = Counter(
+    "subscription_requests_total",
+    "Subscription requests by response status.",
+    ("status",),
+)
+STAGE_SECONDS = Histogram(
+    "subscription_stage_seconds",
+    "Time spent in each stage of the subscription handler.",
+    ("stage",),
+)
+CACHE_EVENTS = Counter(
+    "cache_events_total",
+    "Cache lookups by cache and outcome.",
+    ("cache", "event"),
+)
+UPSTREAM_RESPONSES = Counter(
+    "upstream_responses_total",
+    "Responses received from Marzneshin by request kind and status.",
+    ("kind", "status"),
+)
+TOKEN_REFRESHES = Counter(
+    "token_refreshes_total",
+    "Panel admin token refresh attempts by outcome.",
+    ("outcome",),
+)
+
+
+# Cache name to (entry count, eviction count) readers.
+_watched_caches: dict[str, tuple[Callable[[], int], Callable[[], int]]] = {}
+
+
+def watch_cache(
+    name: str, entries: Callable[[], int], evictions: Callable[[], int]
+) -> None:
+    """Expose a cache's size and eviction count, read at scrape time."""
+    _watched_caches[name] = (entries, evictions)
+
+
+CallbackMetric(
+    "cache_evictions_total",
+    "Entries evicted from a cache to stay within its bound.",
+    lambda: {(name,): readers[1]() for name, readers in _watched_caches.items()},
+    labelnames=("cache",),
+    kind="counter",
+)
+CallbackMetric(
+    "cache_entries",
+    "Entries currently held by a cache.",
+    lambda: {(name,): readers[0]() for name, readers in _watched_caches.items()},
+    labelnames=("cache",),
+)
@@ -0,0 +1,18 @@
+from starlette.middleware.cors import CORSMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+class PathExemptCORSMiddleware(CORSMiddleware):
+    """CORSMiddleware that lets requests under `exempt_prefix` straight through."""
+
+    def __init__(self, app: ASGIApp, exempt_prefix: str | None = None, **kwargs):
+        super().__init__(app, **kwargs)
+        self.exempt_prefix = exempt_prefix.rstrip("/") if exempt_prefix else None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.exempt_prefix and scope["type"] == "http":
+            path = scope["path"]
+            if path == self.exempt_prefix or path.startswith(f"{self.exempt_prefix}/"):
+                await self.app(scope, receive, send)
+                return
+        await super().__call__(scope, receive, send)
@@ -1,39 +1,178 @@
 import httpx
 from utils.log import logger
-from models import UserResponse
+from utils.cache import TTLCache, MISSING
+from utils.client import get_client
+from utils.singleflight import SingleFlight
+from utils.breaker import CircuitOpenError, get_breaker
+from utils.admission import OverloadedError, upstream_gate
+from utils import metrics
+from models import UserSnapshot, UsersPage, TokenUpsert
 from db import TokenManager
-from utils.config import MARZNESHIN_ADDRESS, MARZNESHIN_USERNAME, MARZNESHIN_PASSWORD
+from utils.token_store import TokenStore
+from utils.config import (
+    MARZNESHIN_ADDRESS,
+    MARZNESHIN_USERNAME,
+    MARZNESHIN_PASSWORD,
+    USER_CACHE_SIZE,
+    USER_CACHE_TTL,
+    USER_CACHE_NEGATIVE_TTL,
+    STALE_IF_ERROR,
+)
+
+_user_cache = TTLCache(
+    maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL, stale_ttl=STALE_IF_ERROR
+)
+_flights = SingleFlight()
+metrics.watch_cache("user", lambda: len(_user_cache), lambda: _user_cache.evictions)
 
 
 async def get_token() -> str:
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{MARZNESHIN_ADDRESS}/api/admins/token",
-                data={"username": MARZNESHIN_USERNAME, "password": MARZNESHIN_PASSWORD},
-                headers={"Content-Type": "application/x-www-form-urlencoded"},
-            )
-            response.raise_for_status()
-            data = response.json()
-            return data["access_token"]
+        response = await get_client().post(
+            f"{MARZNESHIN_ADDRESS}/api/admins/token",
+            data={"username": MARZNESHIN_USERNAME, "password": MARZNESHIN_PASSWORD},
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+        )
+        response.raise_for_status()
+        data = response.json()
+        return data["access_token"]
 
     except Exception as e:
         logger.error(f"Error get token {str(e)}")
         return None
 
 
-async def get_user(username: str) -> UserResponse:
+async def _login(stale_token: str | None = None) -> str | None:
+    if stale_token is not None:
+        # With several workers, the elected one may already have saved a new token.
+        try:
+            persisted = await TokenStore.load()
+            if persisted and persisted != stale_token:
+                metrics.TOKEN_REFRESHES.inc("reloaded")
+                return persisted
+        except Exception as e:
+            logger.error(f"Error loading token {str(e)}")
+
+    token = await get_token()
+    if not token:
+        metrics.TOKEN_REFRESHES.inc("failure")
+        return None
+
+    metrics.TOKEN_REFRESHES.inc("success")
+    TokenStore.set(token)
+    try:
+        if not await TokenManager.upsert(TokenUpsert(token=token)):
+            logger.error("Failed to update token in database.")
+    except Exception as e:
+        logger.error(f"Error saving token {str(e)}")
+    return token
+
+
+async def refresh_token(stale_token: str | None = None) -> str | None:
+    """Log in again, sharing a single attempt between concurrent callers.
+
+    When `stale_token` is given and another caller already replaced it, the
+    current token is returned without logging in again.
+    """
+    current = TokenStore.get()
+    if stale_token is not None and current and current != stale_token:
+        return current
+    return await _flights.do("token", lambda: _login(stale_token))
+
+
+async def _guarded_get(url: str, params: dict | None, token: str) -> httpx.Response:
+    """GET through the panel's circuit breaker."""
+    breaker = get_breaker(url)
+    breaker.check()
     try:
-        token = await TokenManager.get()
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{MARZNESHIN_ADDRESS}/api/users/{username}",
-                headers={"Authorization": f"Bearer {token.token}"},
+        async with upstream_gate.slot():
+            response = await get_client().get(
+                url, params=params, headers={"Authorization": f"Bearer {token}"}
             )
-            response.raise_for_status()
-            data = response.json()
-            return UserResponse(**data)
+    except httpx.RequestError:
+        metrics.UPSTREAM_RESPONSES.inc("panel", "error")
+        breaker.record_failure()
+        raise
+
+    metrics.UPSTREAM_RESPONSES.inc("panel", str(response.status_code))
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
+async def _authorized_get(url: str, params: dict | None = None) -> httpx.Response:
+    """GET a panel endpoint, re-authenticating once on 401."""
+    token = TokenStore.get()
+    response = await _guarded_get(url, params, token)
+    if response.status_code != 401:
+        return response
+
+    logger.warning("Panel rejected the admin token, logging in again.")
+    token = await refresh_token(stale_token=token)
+    if not token:
+        return response
+    return await _guarded_get(url, params, token)
+
+
+async def _request_user(username: str) -> httpx.Response:
+    return await _authorized_get(f"{MARZNESHIN_ADDRESS}/api/users/{username}")
+
+
+async def get_user_snapshot(username: str) -> UserSnapshot | None:
+    """Look up a panel user, cached, keeping only what the handler needs.
+
+    Raises CircuitOpenError or OverloadedError when the panel is skipped or
+    saturated and no stale answer is available.
+    """
+    cached = _user_cache.get(username)
+    if cached is not MISSING:
+        metrics.CACHE_EVENTS.inc("user", "hit")
+        return cached
+
+    metrics.CACHE_EVENTS.inc("user", "miss")
+    return await _flights.do(("user", username), lambda: _load_user(username))
+
+
+async def _load_user(username: str) -> UserSnapshot | None:
+    try:
+        response = await _request_user(username)
+        if response.status_code == 404:
+            _user_cache.set(username, None, ttl=USER_CACHE_NEGATIVE_TTL)
+            return None
+
+        response.raise_for_status()
+        user = UserSnapshot.model_validate_json(response.content)
+        _user_cache.set(username, user)
+        return user
 
     except Exception as e:
         logger.error(f"Error get user {str(e)}")
+        # While the panel fails, the last known answer beats a wrong 404.
+        stale = _user_cache.get_stale(username)
+        if stale is not MISSING:
+            return stale
+        if isinstance(e, (CircuitOpenError, OverloadedError)):
+            raise
+        return None
+
+
+async def get_users_page(page: int, size: int) -> UsersPage | None:
+    """One page of all panel users, newest first."""
+    try:
+        response = await _authorized_get(
+            f"{MARZNESHIN_ADDRESS}/api/users",
+            params={
+                "page": page,
+                "size": size,
+                "order_by": "created_at",
+                "descending": "true",
+            },
+        )
+        response.raise_for_status()
+        return UsersPage.model_validate_json(response.content)
+
+    except Exception as e:
+        logger.error(f"Error get users page {page}: {str(e)}")
         return None
@@ -0,0 +1,230 @@
+"""Sampling profiler for the event loop thread.
+
+Profiles are returned as collapsed stacks, one `frame;frame;frame count`
+line per distinct stack, which flamegraph.pl, speedscope and most other
+flamegraph viewers load directly.
+"""
+
+import asyncio
+import contextlib
+import os
+import random
+import sys
+import threading
+from collections import Counter
+from functools import lru_cache
+from types import CodeType, FrameType
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+# Longest first, so files are shown relative to the most specific import root.
+_PATH_PREFIXES = sorted(
+    (os.path.join(os.path.abspath(p), "") for p in sys.path if p),
+    key=len,
+    reverse=True,
+)
+
+_busy = False
+_request_session: "RequestSession | None" = None
+_NOT_PROFILED = contextlib.nullcontext()
+
+
+class ProfilerBusyError(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+
+@lru_cache(maxsize=4096)
+def _short_path(filename: str) -> str:
+    for prefix in _PATH_PREFIXES:
+        if filename.startswith(prefix):
+            return filename[len(prefix) :]
+    return filename
+
+
+def _label(function: str, filename: str, line: int) -> str:
+    return f"{function} ({_short_path(filename)}:{line})"
+
+
+@lru_cache(maxsize=16384)
+def _code_label(code: CodeType) -> str:
+    return _label(code.co_name, code.co_filename, code.co_firstlineno)
+
+
+def collapse(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+class Sampler(threading.Thread):
+    """Record the stack of one thread every `interval` seconds.
+
+    Runs on its own daemon thread and reads the target's frames through
+    `sys._current_frames`, so the profiled code is not instrumented. A
+    sample is taken only when the sampler gets the GIL, so the interpreter
+    switch interval is lowered to `interval` while sampling; otherwise a
+    busy target would only be sampled every 5ms.
+    """
+
+    def __init__(self, thread_id: int, interval: float, keep=None):
+        super().__init__(name="profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        # Optional predicate on the frames of a sample, innermost first.
+        self.keep = keep
+        self.stacks: Counter[str] = Counter()
+        self._stop_event = threading.Event()
+        self._switch_interval = sys.getswitchinterval()
+
+    def start(self) -> None:
+        sys.setswitchinterval(min(self.interval, self._switch_interval))
+        super().start()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame: FrameType | None = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            frames = []
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+            if self.keep is not None and not self.keep(frames):
+                continue
+            stack = ";".join(_code_label(f.f_code) for f in reversed(frames))
+            self.stacks[stack] += 1
+
+    def stop(self) -> Counter:
+        self._stop_event.set()
+        self.join()
+        sys.setswitchinterval(self._switch_interval)
+        return self.stacks
+
+
+class RequestSession:
+    """Profile `count` subscription requests, each picked with probability `rate`.
+
+    Only samples taken while one of the picked requests is running on the
+    loop are kept, so concurrent requests do not leak into the profile.
+    """
+
+    def __init__(self, count: int, rate: float, interval: float):
+        self.remaining = count
+        self.pending = count
+        self.rate = rate
+        self.frames: set[FrameType] = set()
+        self.done = asyncio.Event()
+        self.sampler = Sampler(threading.get_ident(), interval, keep=self._keep)
+
+    def _keep(self, frames: list[FrameType]) -> bool:
+        targets = self.frames
+        return any(frame in targets for frame in frames)
+
+    def pick(self) -> bool:
+        if self.remaining > 0 and random.random() < self.rate:
+            self.remaining -= 1
+            return True
+        return False
+
+    def finished(self, frame: FrameType) -> None:
+        self.frames.discard(frame)
+        self.pending -= 1
+        if not self.pending:
+            self.done.set()
+
+
+class _ProfiledRequest:
+    __slots__ = ("session", "frame")
+
+    def __init__(self, session: RequestSession, frame: FrameType):
+        self.session = session
+        self.frame = frame
+
+    def __enter__(self) -> None:
+        self.session.frames.add(self.frame)
+
+    def __exit__(self, *exc_info) -> None:
+        self.session.finished(self.frame)
+
+
+def request_profile():
+    """Context manager profiling the calling request if a session picks it.
+
+    Costs one attribute check while no request session is running.
+    """
+    session = _request_session
+    if session is None or not session.pick():
+        return _NOT_PROFILED
+    # The caller's coroutine frame appears in every sample taken while it runs.
+    return _ProfiledRequest(session, sys._getframe(1))
+
+
+@contextlib.contextmanager
+def _exclusive():
+    global _busy
+    if _busy:
+        raise ProfilerBusyError("A profile is already running")
+    _busy = True
+    try:
+        yield
+    finally:
+        _busy = False
+
+
+async def profile_loop(seconds: float, interval: float, engine: str) -> str:
+    """Profile everything the event loop runs for `seconds`.
+
+    Must be awaited on the loop being profiled. With pyinstrument the
+    counts are microseconds of self time rather than sample counts.
+    """
+    with _exclusive():
+        if engine == "pyinstrument":
+            profiler = pyinstrument.Profiler(interval=interval, async_mode="disabled")
+            profiler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                session = profiler.stop()
+            stacks: Counter[str] = Counter()
+            root = session.root_frame()
+            if root is not None:
+                _collapse_pyinstrument(root, "", stacks)
+            return collapse(stacks)
+
+        sampler = Sampler(threading.get_ident(), interval)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stacks = sampler.stop()
+        return collapse(stacks)
+
+
+async def profile_requests(
+    count: int, rate: float, interval: float, timeout: float
+) -> tuple[str, int]:
+    """Profile up to `count` sampled requests; return the stacks and requests seen."""
+    global _request_session
+    with _exclusive():
+        session = RequestSession(count, rate, interval)
+        session.sampler.start()
+        _request_session = session
+        try:
+            await asyncio.wait_for(session.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            _request_session = None
+            stacks = session.sampler.stop()
+        return collapse(stacks), count - session.pending
+
+
+def _collapse_pyinstrument(frame, prefix: str, stacks: Counter) -> None:
+    label = _label(frame.function, frame.file_path or "", frame.line_no or 0)
+    stack = f"{prefix};{label}" if prefix else label
+    self_time = frame.time - sum(child.time for child in frame.children)
+    if self_time > 0:
+        stacks[stack] += round(self_time * 1_000_000)
+    for child in frame.children:
+        _collapse_pyinstrument(child, stack, stacks)
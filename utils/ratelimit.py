@@ -0,0 +1,65 @@
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+# Idle buckets dropped per call, so cleanup keeps ahead of new keys
+# without ever scanning the whole map at once.
+_SWEEP_BATCH = 2
+
+
+class TokenBuckets:
+    """Token-bucket rate limits for many keys, e.g. one per client IP.
+
+    A bucket that has refilled completely is indistinguishable from a new
+    one, so idle buckets are dropped as requests come in and the map only
+    holds recently active keys. Buckets are kept in order of last use, so
+    both dropping idle ones and forgetting the oldest when full are O(1).
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[Hashable, list[float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def acquire(self, key: Hashable) -> float:
+        """Take one token for `key`; return 0 if allowed, else seconds to wait."""
+        now = time.monotonic()
+        self.sweep(now, _SWEEP_BATCH)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                # Full of active keys, forget the least recently used one.
+                self._buckets.popitem(last=False)
+            self._buckets[key] = [self.burst - 1, now]
+            return 0.0
+
+        self._buckets.move_to_end(key)
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+
+        bucket[0] = tokens
+        return (1 - tokens) / self.rate
+
+    def sweep(self, now: float | None = None, limit: int | None = None) -> None:
+        """Drop up to `limit` buckets that have refilled completely."""
+        now = time.monotonic() if now is None else now
+        refill_time = self.burst / self.rate
+        while self._buckets and limit != 0:
+            key, bucket = next(iter(self._buckets.items()))
+            if now - bucket[1] < refill_time:
+                break
+            del self._buckets[key]
+            if limit is not None:
+                limit -= 1
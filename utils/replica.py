@@ -0,0 +1,80 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from hashlib import blake2b
+from pydantic import TypeAdapter
+from db import UserReplicaManager
+from models import ReplicaUser
+from utils.config import USER_SYNC_INTERVAL, USER_CACHE_TTL
+
+# Past this age entries may hide a revocation for longer than a cached lookup
+# would. Other workers pick up the leader's copy up to one interval late.
+_MAX_AGE = 2 * USER_SYNC_INTERVAL + USER_CACHE_TTL
+
+_users_adapter = TypeAdapter(dict[str, ReplicaUser])
+
+
+class UserReplica:
+    """Local copy of the panel's users, refreshed in bulk by the `user_sync` job.
+
+    With several workers only the leader pages through the panel; it saves
+    the replica to SQLite and the others load it from there. The saved
+    copy carries a hash of its content, so an unchanged user list is
+    neither rewritten nor parsed again; encoding and parsing run in a
+    thread so request handling is not stalled by large replicas.
+    """
+
+    _users: dict[str, ReplicaUser] = {}
+    _synced_at: float | None = None
+    _version: str | None = None
+
+    @classmethod
+    def get(cls, username: str) -> ReplicaUser | None:
+        """The replicated user, or None when unknown or the replica is too old."""
+        if cls._synced_at is None or time.time() - cls._synced_at > _MAX_AGE:
+            return None
+        return cls._users.get(username)
+
+    @classmethod
+    def size(cls) -> int:
+        return len(cls._users)
+
+    @classmethod
+    def replace(cls, users: dict[str, ReplicaUser]) -> None:
+        cls._users = users
+        cls._synced_at = time.time()
+
+    @classmethod
+    async def save(cls) -> None:
+        """Share the replica with the other workers."""
+        synced_at = datetime.fromtimestamp(cls._synced_at, tz=timezone.utc)
+        users, version = await asyncio.to_thread(_encode, cls._users)
+        if version == cls._version and await UserReplicaManager.touch(synced_at):
+            return
+        await UserReplicaManager.save(users, version, synced_at)
+        cls._version = version
+
+    @classmethod
+    async def load(cls) -> bool:
+        """Pick up the replica saved by the leader if it is newer than ours."""
+        state = await UserReplicaManager.state()
+        if state is None:
+            return False
+
+        version, synced_at = state
+        synced_at = synced_at.replace(tzinfo=timezone.utc).timestamp()
+        if cls._synced_at is not None and synced_at <= cls._synced_at:
+            return True
+        if version is None or version != cls._version:
+            users = await UserReplicaManager.users()
+            if users is None:
+                return False
+            cls._users = await asyncio.to_thread(_users_adapter.validate_json, users)
+            cls._version = version
+        cls._synced_at = synced_at
+        return True
+
+
+def _encode(users: dict[str, ReplicaUser]) -> tuple[str, str]:
+    data = _users_adapter.dump_json(users)
+    return data.decode(), blake2b(data, digest_size=16).hexdigest()
@@ -0,0 +1,328 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+from hashlib import blake2b, sha256
+from typing import BinaryIO
+from db import SnapshotManager, SubscriptionSnapshot
+from utils.log import logger
+from utils.compression import COMPRESSORS
+from utils import metrics
+from utils.config import (
+    SUB_CACHE_TTL,
+    SUB_DISK_CACHE_DIR,
+    SUB_DISK_CACHE_MAX_BYTES,
+    STALE_IF_ERROR,
+)
+
+# Files younger than this may belong to a write another worker has not indexed yet.
+_ORPHAN_GRACE = 60.0
+_EVICTION_BATCH = 64
+
+
+class Snapshot:
+    """A subscription body kept on disk, shaped like `upstream.CachedSubscription`.
+
+    Files are named after the body's version and never rewritten, so a
+    reader holding a snapshot either finds the exact body it describes or
+    no file at all.
+    """
+
+    __slots__ = (
+        "digest",
+        "version",
+        "url",
+        "path",
+        "headers",
+        "media_type",
+        "etag",
+        "last_modified",
+        "size",
+        "disk_size",
+        "encodings",
+        "expires_at",
+    )
+
+    content = None
+    status_code = 200
+
+    def __init__(
+        self,
+        digest: str,
+        version: str,
+        url: str,
+        headers: dict[str, str],
+        media_type: str,
+        etag: str | None,
+        last_modified: str | None,
+        size: int,
+        fetched_at: float,
+        encodings: dict[str, int] | None = None,
+    ):
+        self.digest = digest
+        self.version = version
+        self.url = url
+        self.path = os.path.join(SUB_DISK_CACHE_DIR, f"{digest}-{version}")
+        self.headers = headers
+        self.media_type = media_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.size = size
+        # Compressed copies stored beside the body, with their sizes, by preference.
+        encodings = encodings or {}
+        self.encodings = {e: encodings[e] for e in COMPRESSORS if e in encodings}
+        self.disk_size = size + sum(self.encodings.values())
+        self.expires_at = time.monotonic() + fetched_at + SUB_CACHE_TTL - time.time()
+
+    @classmethod
+    def from_row(
+        cls, row: SubscriptionSnapshot, encodings: dict[str, int] | None = None
+    ) -> "Snapshot":
+        return cls(
+            digest=row.key,
+            version=row.version,
+            url=row.url,
+            headers=json.loads(row.headers),
+            media_type=row.media_type,
+            etag=row.etag,
+            last_modified=row.last_modified,
+            size=row.size,
+            fetched_at=row.fetched_at.replace(tzinfo=timezone.utc).timestamp(),
+            encodings=(
+                json.loads(row.encodings or "{}") if encodings is None else encodings
+            ),
+        )
+
+    @property
+    def usable_when_stale(self) -> bool:
+        return self.expires_at + STALE_IF_ERROR > time.monotonic()
+
+    def variant_path(self, encoding: str | None) -> str:
+        return f"{self.path}.{encoding}" if encoding else self.path
+
+    def paths(self) -> list[str]:
+        return [self.variant_path(encoding) for encoding in (None, *self.encodings)]
+
+    async def open(self, encoding: str | None) -> tuple[BinaryIO, os.stat_result]:
+        """Open a variant for reading; the open file outlives its eviction."""
+        return await asyncio.to_thread(_open, self.variant_path(encoding))
+
+    def to_row(self) -> SubscriptionSnapshot:
+        fetched_at = self.expires_at - SUB_CACHE_TTL - time.monotonic() + time.time()
+        return SubscriptionSnapshot(
+            key=self.digest,
+            url=self.url,
+            media_type=self.media_type,
+            headers=json.dumps(self.headers),
+            etag=self.etag,
+            last_modified=self.last_modified,
+            size=self.size,
+            fetched_at=datetime.fromtimestamp(fetched_at, tz=timezone.utc),
+            version=self.version,
+            encodings=json.dumps(self.encodings),
+            disk_size=self.disk_size,
+        )
+
+
+class SnapshotStore:
+    """Disk tier below the in-memory body cache, indexed in the database.
+
+    Survives restarts, so a redeploy serves from disk instead of
+    refetching every subscription from the panel. The database is the
+    index shared by all workers: each worker keeps the snapshots it has
+    seen in `_entries`, checks the database again once its copy expires,
+    and evicts the oldest fetches across all workers to stay under the
+    size limit.
+    """
+
+    _entries: dict[str, Snapshot] = {}
+    evictions = 0
+
+    @staticmethod
+    def enabled() -> bool:
+        return bool(SUB_DISK_CACHE_DIR) and SUB_DISK_CACHE_MAX_BYTES > 0
+
+    @staticmethod
+    def digest(key: tuple) -> str:
+        return sha256(repr(key).encode()).hexdigest()
+
+    @classmethod
+    def peek(cls, key: tuple) -> Snapshot | None:
+        """Return this worker's copy of a snapshot without checking disk."""
+        return cls._entries.get(cls.digest(key))
+
+    @classmethod
+    async def get(cls, key: tuple) -> Snapshot | None:
+        if not cls.enabled():
+            return None
+
+        digest = cls.digest(key)
+        snapshot = cls._entries.get(digest)
+        # A missing file is found when the response opens it, which then
+        # discards the entry and looks again.
+        if snapshot is not None and snapshot.expires_at > time.monotonic():
+            return snapshot
+
+        # Another worker may have refreshed, replaced or evicted it.
+        try:
+            row = await SnapshotManager.get(digest)
+        except Exception as e:
+            logger.error(f"Error reading subscription snapshot: {str(e)}")
+            return None
+        if row is None or not row.version:
+            cls._entries.pop(digest, None)
+            return None
+
+        snapshot = Snapshot.from_row(row)
+        if not await asyncio.to_thread(os.path.isfile, snapshot.path):
+            cls._entries.pop(digest, None)
+            return None
+        cls._entries[digest] = snapshot
+        return snapshot
+
+    @classmethod
+    def discard(cls, digest: str) -> None:
+        """Forget this worker's copy, e.g. after its file turned out to be gone."""
+        cls._entries.pop(digest, None)
+
+    @classmethod
+    async def load(cls) -> None:
+        """Index the snapshots left by previous runs and drop unusable files."""
+        if not cls.enabled():
+            return
+
+        os.makedirs(SUB_DISK_CACHE_DIR, exist_ok=True)
+        files = set(os.listdir(SUB_DISK_CACHE_DIR))
+        referenced = set()
+        missing = []
+        for row in await SnapshotManager.get_all():
+            if not row.version or f"{row.key}-{row.version}" not in files:
+                missing.append(row.key)
+                continue
+            encodings = {
+                encoding: size
+                for encoding, size in json.loads(row.encodings or "{}").items()
+                if f"{row.key}-{row.version}.{encoding}" in files
+            }
+            snapshot = Snapshot.from_row(row, encodings)
+            if snapshot.disk_size != row.disk_size:
+                await SnapshotManager.upsert(snapshot.to_row())
+            cls._entries[row.key] = snapshot
+            referenced.update(os.path.basename(path) for path in snapshot.paths())
+
+        now = time.time()
+        for name in files - referenced:
+            path = os.path.join(SUB_DISK_CACHE_DIR, name)
+            try:
+                if now - os.path.getmtime(path) > _ORPHAN_GRACE:
+                    os.unlink(path)
+            except OSError:
+                pass
+
+        await SnapshotManager.delete(missing)
+        await cls._evict()
+        logger.info(
+            f"Loaded {len(cls._entries)} subscription snapshots "
+            f"({await SnapshotManager.total_size()} bytes)."
+        )
+
+    @classmethod
+    async def store(cls, key: tuple, url: str, subscription) -> None:
+        """Write a fetched body to disk and record it in the index."""
+        digest = cls.digest(key)
+        snapshot = Snapshot(
+            digest=digest,
+            version=blake2b(subscription.content, digest_size=8).hexdigest(),
+            url=url,
+            headers=subscription.headers,
+            media_type=subscription.media_type,
+            etag=subscription.etag,
+            last_modified=subscription.last_modified,
+            size=len(subscription.content),
+            fetched_at=time.time(),
+            encodings={
+                encoding: len(data) for encoding, data in subscription.variants.items()
+            },
+        )
+        try:
+            previous = await SnapshotManager.get(digest)
+            await asyncio.to_thread(_write_atomic, snapshot.path, subscription.content)
+            for encoding, data in subscription.variants.items():
+                await asyncio.to_thread(
+                    _write_atomic, snapshot.variant_path(encoding), data
+                )
+            await SnapshotManager.upsert(snapshot.to_row())
+            cls._entries[digest] = snapshot
+            if previous is not None and previous.version:
+                # Readers that already opened the old files keep them until they finish.
+                kept = set(snapshot.paths())
+                for path in Snapshot.from_row(previous).paths():
+                    if path not in kept:
+                        _unlink(path)
+            await cls._evict()
+        except Exception as e:
+            logger.error(f"Error storing subscription snapshot: {str(e)}")
+
+    @classmethod
+    async def touch(cls, key: tuple) -> None:
+        """Mark a snapshot fresh again after the panel answered 304."""
+        snapshot = cls._entries.get(cls.digest(key))
+        if snapshot is None:
+            return
+
+        snapshot.expires_at = time.monotonic() + SUB_CACHE_TTL
+        try:
+            await SnapshotManager.upsert(snapshot.to_row())
+        except Exception as e:
+            logger.error(f"Error updating subscription snapshot: {str(e)}")
+
+    @classmethod
+    async def _evict(cls) -> None:
+        total = await SnapshotManager.total_size()
+        while total > SUB_DISK_CACHE_MAX_BYTES:
+            rows = await SnapshotManager.oldest(_EVICTION_BATCH)
+            if not rows:
+                return
+            evicted = []
+            for row in rows:
+                if total <= SUB_DISK_CACHE_MAX_BYTES:
+                    break
+                total -= row.disk_size or 0
+                cls.evictions += 1
+                evicted.append(row.key)
+                cls._entries.pop(row.key, None)
+                if row.version:
+                    for path in Snapshot.from_row(row).paths():
+                        _unlink(path)
+            await SnapshotManager.delete(evicted)
+
+
+metrics.watch_cache(
+    "disk", lambda: len(SnapshotStore._entries), lambda: SnapshotStore.evictions
+)
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _open(path: str) -> tuple[BinaryIO, os.stat_result]:
+    file = open(path, "rb")
+    return file, os.fstat(file.fileno())
+
+
+def _write_atomic(path: str, content: bytes) -> None:
+    """Write `content` beside `path` and rename it into place."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
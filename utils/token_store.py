@@ -0,0 +1,46 @@
+import json
+from base64 import urlsafe_b64decode
+from db import TokenManager
+
+
+def _jwt_expiry(token: str) -> float | None:
+    """Read the `exp` claim of a JWT without verifying it."""
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenStore:
+    """In-process copy of the Marzneshin admin token.
+
+    SQLite only persists the token across restarts; request handlers read it
+    from here so they never touch the database.
+    """
+
+    _token: tuple[str, float | None] | None = None
+
+    @classmethod
+    def get(cls) -> str | None:
+        current = cls._token
+        return current[0] if current else None
+
+    @classmethod
+    def expires_at(cls) -> float | None:
+        """Unix time at which the current token expires, when it is known."""
+        current = cls._token
+        return current[1] if current else None
+
+    @classmethod
+    def set(cls, token: str) -> None:
+        cls._token = (token, _jwt_expiry(token))
+
+    @classmethod
+    async def load(cls) -> str | None:
+        """Restore the last persisted token, e.g. right after startup."""
+        token_data = await TokenManager.get()
+        if token_data:
+            cls.set(token_data.token)
+        return cls.get()
@@ -0,0 +1,125 @@
+import json
+import logging
+import random
+import time
+import uuid
+from collections import deque
+from utils import metrics
+from utils.log import file_handler, queue_handlers
+from utils.config import (
+    TRACE_SAMPLE_RATE,
+    TRACE_SLOW_THRESHOLD,
+    TRACE_EXPORTER,
+    TRACE_BUFFER_SIZE,
+    TRACE_FILE,
+    TRACE_FILE_MAX_BYTES,
+    TRACE_FILE_BACKUPS,
+)
+
+_buffer: deque[dict] = deque(maxlen=TRACE_BUFFER_SIZE)
+_file_logger: logging.Logger | None = None
+
+
+class Stage:
+    """A named step of the handler, timed into traces and the stage histogram."""
+
+    __slots__ = ("name", "histogram")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.histogram = metrics.STAGE_SECONDS.labels(name)
+
+
+class Trace:
+    """Spans of one request.
+
+    Spans are always recorded, since a request is only known to be slow
+    once it ends. Whether the trace is exported is decided in `finish`.
+    """
+
+    __slots__ = ("started", "spans", "attributes")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: list[tuple[str, float, float]] = []
+        self.attributes: dict[str, str] = {}
+
+    def span(self, stage: Stage) -> "_Span":
+        return _Span(self, stage)
+
+    def server_timing(self, total: float) -> str:
+        """The spans as a `Server-Timing` header value, in milliseconds."""
+        entries = [
+            f"{name};dur={duration * 1000:.2f}" for name, _, duration in self.spans
+        ]
+        entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+    def finish(self, status_code: int) -> float:
+        """Export the trace if it is sampled or slow; return the total duration."""
+        total = time.perf_counter() - self.started
+        slow = 0 < TRACE_SLOW_THRESHOLD <= total
+        if slow or (TRACE_SAMPLE_RATE and random.random() < TRACE_SAMPLE_RATE):
+            _export(
+                {
+                    "trace_id": uuid.uuid4().hex,
+                    "timestamp": time.time(),
+                    "status": status_code,
+                    "duration_ms": round(total * 1000, 3),
+                    "slow": slow,
+                    **self.attributes,
+                    "spans": [
+                        {
+                            "name": name,
+                            "start_ms": round(start * 1000, 3),
+                            "duration_ms": round(duration * 1000, 3),
+                        }
+                        for name, start, duration in self.spans
+                    ],
+                }
+            )
+        return total
+
+
+class _Span:
+    __slots__ = ("trace", "stage", "started")
+
+    def __init__(self, trace: Trace, stage: Stage):
+        self.trace = trace
+        self.stage = stage
+
+    def __enter__(self) -> "_Span":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        duration = time.perf_counter() - self.started
+        self.stage.histogram.observe(duration)
+        self.trace.spans.append(
+            (self.stage.name, self.started - self.trace.started, duration)
+        )
+
+
+def _get_file_logger() -> logging.Logger:
+    global _file_logger
+    if _file_logger is None:
+        _file_logger = logging.getLogger("MarzneshinMigration.traces")
+        _file_logger.propagate = False
+        _file_logger.setLevel(logging.INFO)
+        handler = file_handler(TRACE_FILE, TRACE_FILE_MAX_BYTES, TRACE_FILE_BACKUPS)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _file_logger.addHandler(queue_handlers(handler))
+    return _file_logger
+
+
+def _export(record: dict) -> None:
+    if TRACE_EXPORTER == "file":
+        _get_file_logger().info(json.dumps(record))
+    else:
+        _buffer.append(record)
+
+
+def recent(limit: int, slow_only: bool = False) -> list[dict]:
+    """The newest traces held in memory, newest first."""
+    traces = [t for t in reversed(_buffer) if t["slow"] or not slow_only]
+    return traces[:limit]
@@ -0,0 +1,426 @@
+import asyncio
+import gzip
+import time
+import zlib
+from email.utils import formatdate, parsedate_to_datetime
+from hashlib import blake2b
+from typing import AsyncIterator, Iterable, Mapping
+from urllib.parse import urlsplit
+import httpx
+from utils.log import logger
+from utils.cache import SizedLRUCache
+from utils.client import get_client
+from utils.singleflight import SingleFlight
+from utils.hotkeys import HotKeys
+from utils import compression
+from utils.snapshots import Snapshot, SnapshotStore
+from utils.breaker import CircuitOpenError, get_breaker, on_recovery
+from utils.admission import OverloadedError, upstream_gate
+from utils import metrics
+from utils.config import (
+    SUB_CACHE_TTL,
+    SUB_CACHE_MAX_BYTES,
+    SUB_COMPRESSION_MIN_SIZE,
+    SUB_CONNECT_TIMEOUT,
+    SUB_READ_TIMEOUT,
+    STALE_IF_ERROR,
+    REFRESH_AHEAD_ENABLED,
+    REFRESH_AHEAD_TOP_N,
+    REFRESH_AHEAD_WINDOW,
+    REFRESH_AHEAD_CONCURRENCY,
+)
+
+HOP_BY_HOP_HEADERS = frozenset(
+    (
+        "connection",
+        "keep-alive",
+        "proxy-authenticate",
+        "proxy-authorization",
+        "proxy-connection",
+        "te",
+        "trailer",
+        "trailers",
+        "transfer-encoding",
+        "upgrade",
+    )
+)
+# httpx hands buffered bodies over decoded, so these no longer describe them.
+_REPRESENTATION_HEADERS = frozenset(("content-length", "content-encoding", "date"))
+_CONDITIONAL_HEADERS = frozenset(("if-none-match", "if-modified-since"))
+# Sent along with a 304 in place of the full response headers.
+_NOT_MODIFIED_HEADERS = frozenset(
+    ("etag", "last-modified", "cache-control", "expires", "vary", "content-location")
+)
+_PROBE = b"subscription" * 8
+
+
+def _decodable_encodings() -> list[str]:
+    """Content codings httpx can undo here, found by decoding a sample of each."""
+    samples = {"gzip": gzip.compress(_PROBE), "deflate": zlib.compress(_PROBE)}
+    if compression.brotli is not None:
+        samples["br"] = compression.brotli.compress(_PROBE)
+    if compression.zstandard is not None:
+        samples["zstd"] = compression.zstandard.ZstdCompressor().compress(_PROBE)
+
+    decodable = []
+    for encoding, body in samples.items():
+        # Unknown codings are passed through, so the body comes back unchanged.
+        response = httpx.Response(
+            200, headers={"content-encoding": encoding}, content=body
+        )
+        try:
+            if response.read() == _PROBE:
+                decodable.append(encoding)
+        except httpx.DecodingError:
+            pass
+    return decodable
+
+
+# Cached bodies are stored decoded, so only ask for codings httpx can undo.
+_ACCEPT_ENCODING = ", ".join(_decodable_encodings())
+_TIMEOUT = httpx.Timeout(SUB_READ_TIMEOUT, connect=SUB_CONNECT_TIMEOUT)
+_MAX_PENDING_REVALIDATIONS = 1000
+_REVALIDATION_CONCURRENCY = 4
+
+_cache = SizedLRUCache(max_bytes=SUB_CACHE_MAX_BYTES)
+_flights = SingleFlight()
+# Stale entries served during an outage, refreshed once the upstream recovers.
+_pending: dict[tuple, tuple[str, dict[str, str], list[tuple[str, str]]]] = {}
+_background: set[asyncio.Task] = set()
+# Most requested cache keys, kept warm by the `refresh_ahead` job.
+_hot = HotKeys(size=REFRESH_AHEAD_TOP_N)
+metrics.watch_cache("body", lambda: len(_cache), lambda: _cache.evictions)
+
+
+class CachedSubscription:
+    __slots__ = (
+        "content",
+        "status_code",
+        "headers",
+        "media_type",
+        "etag",
+        "last_modified",
+        "expires_at",
+        "variants",
+    )
+
+    path = None
+
+    def __init__(self, response: httpx.Response):
+        self.content = response.content
+        self.status_code = response.status_code
+        self.headers = filter_headers(response.headers, _REPRESENTATION_HEADERS)
+        self.media_type = response.headers.get("content-type", "text/plain")
+        self.etag = self.headers.setdefault(
+            "etag", f'"{blake2b(self.content, digest_size=16).hexdigest()}"'
+        )
+        self.last_modified = self.headers.setdefault(
+            "last-modified", formatdate(usegmt=True)
+        )
+        self.expires_at = time.monotonic() + SUB_CACHE_TTL
+        # Compressed copies of `content`, keyed by content-coding.
+        self.variants: dict[str, bytes] = {}
+
+    @property
+    def encodings(self) -> Iterable[str]:
+        return self.variants.keys()
+
+    @property
+    def memory_size(self) -> int:
+        return len(self.content) + sum(map(len, self.variants.values()))
+
+    def body(self, encoding: str | None) -> bytes:
+        return self.variants[encoding] if encoding else self.content
+
+    @property
+    def cacheable(self) -> bool:
+        return self.status_code == 200 and SUB_CACHE_TTL > 0
+
+    @property
+    def usable_when_stale(self) -> bool:
+        return self.expires_at + STALE_IF_ERROR > time.monotonic()
+
+
+def filter_headers(
+    headers: Mapping[str, str], exclude: Iterable[str] = ()
+) -> dict[str, str]:
+    """Drop hop-by-hop headers, including any named by `Connection`."""
+    dropped = HOP_BY_HOP_HEADERS.union(exclude)
+    connection = headers.get("connection")
+    if connection:
+        dropped = dropped.union(h.strip().lower() for h in connection.split(","))
+    return {k: v for k, v in headers.items() if k.lower() not in dropped}
+
+
+def representation(
+    subscription: CachedSubscription | Snapshot, accept_encoding: str | None
+) -> tuple[str | None, dict[str, str]]:
+    """Choose the content-coding for a client and the headers describing it."""
+    headers = subscription.headers
+    encoding = compression.negotiate(accept_encoding, subscription.encodings)
+    if subscription.encodings:
+        vary = headers.get("vary")
+        headers = {
+            **headers,
+            "vary": f"{vary}, Accept-Encoding" if vary else "Accept-Encoding",
+        }
+        if encoding:
+            headers["content-encoding"] = encoding
+            etag = headers.get("etag")
+            # Each encoding is a different representation, so it gets its own tag.
+            if etag and etag.endswith('"'):
+                headers["etag"] = f'{etag[:-1]}-{encoding}"'
+    return encoding, headers
+
+
+def not_modified(
+    request_headers: Mapping[str, str], response_headers: Mapping[str, str]
+) -> bool:
+    """Whether the client's validators still match the response being sent."""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        etag = response_headers.get("etag")
+        if not etag:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        etag = etag.removeprefix("W/")
+        return any(
+            tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(",")
+        )
+
+    if_modified_since = request_headers.get("if-modified-since")
+    last_modified = response_headers.get("last-modified")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(
+                if_modified_since
+            )
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def not_modified_headers(response_headers: Mapping[str, str]) -> dict[str, str]:
+    return {k: v for k, v in response_headers.items() if k in _NOT_MODIFIED_HEADERS}
+
+
+def user_agent_family(user_agent: str) -> str:
+    """Reduce a User-Agent to its leading product token, e.g. `v2rayng/1.8.5`."""
+    return user_agent.split(" ", 1)[0].lower()
+
+
+def cache_key(url: str, user_agent: str, params: Iterable[tuple[str, str]]) -> tuple:
+    return url, user_agent_family(user_agent), tuple(sorted(params))
+
+
+async def fetch_subscription(
+    url: str, headers: dict[str, str], params: list[tuple[str, str]]
+) -> CachedSubscription | Snapshot:
+    """Fetch a subscription body, serving and revalidating cached copies.
+
+    Results read from the disk tier carry a `path` instead of `content`.
+    """
+    key = cache_key(url, headers.get("user-agent", ""), params)
+    if REFRESH_AHEAD_ENABLED:
+        _hot.record(key, (url, headers, params))
+    cached = await _lookup(key)
+    if cached and cached.expires_at > time.monotonic():
+        metrics.CACHE_EVENTS.inc("body", "disk_hit" if cached.path else "hit")
+        return cached
+
+    metrics.CACHE_EVENTS.inc("body", "miss")
+    # Callers sharing a key would receive the same body, so one fetch serves all.
+    return await _flights.do(key, lambda: _fetch(key, url, headers, params))
+
+
+async def _lookup(key: tuple) -> CachedSubscription | Snapshot | None:
+    """Return the freshest cached copy, looking on disk once memory has none."""
+    cached = _cache.get(key)
+    if cached and cached.expires_at > time.monotonic():
+        return cached
+    snapshot = await SnapshotStore.get(key)
+    if snapshot and (not cached or snapshot.expires_at > cached.expires_at):
+        return snapshot
+    return cached
+
+
+async def _fetch(
+    key: tuple, url: str, headers: dict[str, str], params: list[tuple[str, str]]
+) -> CachedSubscription | Snapshot:
+    # The result may be shared with other callers, so their validators must not leak upstream.
+    headers = {k: v for k, v in headers.items() if k not in _CONDITIONAL_HEADERS}
+    headers["accept-encoding"] = _ACCEPT_ENCODING
+    cached = await _lookup(key)
+    if cached:
+        if cached.etag:
+            headers["if-none-match"] = cached.etag
+        if cached.last_modified:
+            headers["if-modified-since"] = cached.last_modified
+
+    breaker = get_breaker(url)
+    try:
+        breaker.check()
+        async with upstream_gate.slot():
+            response = await get_client().get(
+                url,
+                headers=headers,
+                params=params,
+                follow_redirects=True,
+                timeout=_TIMEOUT,
+            )
+    except (CircuitOpenError, OverloadedError, httpx.RequestError) as e:
+        if isinstance(e, httpx.RequestError):
+            metrics.UPSTREAM_RESPONSES.inc("subscription", "error")
+            breaker.record_failure()
+        if not (cached and cached.usable_when_stale):
+            raise
+        return _serve_stale(key, cached, url, headers, params)
+
+    metrics.UPSTREAM_RESPONSES.inc("subscription", str(response.status_code))
+    if response.status_code >= 500:
+        breaker.record_failure()
+        if cached and cached.usable_when_stale:
+            return _serve_stale(key, cached, url, headers, params)
+    else:
+        breaker.record_success()
+
+    if cached and response.status_code == 304:
+        cached.expires_at = time.monotonic() + SUB_CACHE_TTL
+        if SnapshotStore.enabled():
+            _spawn(SnapshotStore.touch(key))
+        return cached
+
+    result = CachedSubscription(response)
+    # An unchanged body keeps its Last-Modified, so client validators stay valid.
+    if (
+        cached
+        and cached.last_modified
+        and result.etag == cached.etag
+        and "last-modified" not in response.headers
+    ):
+        result.headers["last-modified"] = result.last_modified = cached.last_modified
+    if result.cacheable:
+        # Compress once per body change rather than once per request.
+        if isinstance(cached, CachedSubscription) and cached.etag == result.etag:
+            result.variants = cached.variants
+        elif len(result.content) >= SUB_COMPRESSION_MIN_SIZE:
+            result.variants = await asyncio.to_thread(
+                compression.compress_all, result.content
+            )
+        _cache.set(key, result, result.memory_size)
+        if SnapshotStore.enabled():
+            _spawn(SnapshotStore.store(key, url, result))
+    else:
+        _cache.pop(key)
+    return result
+
+
+async def drain(timeout: float = 5.0) -> None:
+    """Wait for background writes and refetches before shutting down."""
+    if _background:
+        await asyncio.wait(list(_background), timeout=timeout)
+
+
+def _spawn(coro) -> None:
+    task = asyncio.ensure_future(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+def _serve_stale(
+    key: tuple,
+    cached: CachedSubscription | Snapshot,
+    url: str,
+    headers: dict[str, str],
+    params: list[tuple[str, str]],
+) -> CachedSubscription:
+    metrics.CACHE_EVENTS.inc("body", "stale")
+    if key in _pending or len(_pending) < _MAX_PENDING_REVALIDATIONS:
+        _pending[key] = (url, headers, params)
+    return cached
+
+
+@on_recovery
+def _revalidate_after_recovery(host: str) -> None:
+    pending = {
+        key: args for key, args in _pending.items() if urlsplit(args[0]).netloc == host
+    }
+    if not pending:
+        return
+
+    for key in pending:
+        del _pending[key]
+    _spawn(_revalidate(pending))
+
+
+async def _revalidate(pending: dict) -> None:
+    """Refresh entries that were served stale while the upstream was failing."""
+    await _refetch(pending, _REVALIDATION_CONCURRENCY)
+    logger.info(f"Revalidated {len(pending)} subscriptions after upstream recovery.")
+
+
+async def refresh_hot() -> int:
+    """Refetch hot subscriptions whose cached copy expires within the window."""
+    deadline = time.monotonic() + REFRESH_AHEAD_WINDOW
+    due = {}
+    for key, args in _hot.items():
+        cached = _cache.get(key) or SnapshotStore.peek(key)
+        if cached and cached.expires_at <= deadline and key not in _flights:
+            due[key] = args
+
+    await _refetch(due, REFRESH_AHEAD_CONCURRENCY)
+    return len(due)
+
+
+def decay_hot() -> None:
+    _hot.decay()
+
+
+async def _refetch(entries: dict, concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def refetch(key: tuple, url: str, headers: dict, params: list) -> None:
+        async with semaphore:
+            try:
+                await _flights.do(key, lambda: _fetch(key, url, headers, params))
+            except Exception as e:
+                logger.error(f"Error refetching subscription: {str(e)}")
+
+    await asyncio.gather(*(refetch(key, *args) for key, args in entries.items()))
+
+
+async def open_subscription_stream(
+    url: str, headers: dict[str, str], params: list[tuple[str, str]]
+) -> httpx.Response:
+    """Start an uncached upstream fetch whose body is read with `iter_raw`."""
+    breaker = get_breaker(url)
+    breaker.check()
+
+    client = get_client()
+    request = client.build_request(
+        "GET", url, headers=headers, params=params, timeout=_TIMEOUT
+    )
+    try:
+        async with upstream_gate.slot():
+            response = await client.send(request, stream=True, follow_redirects=True)
+    except httpx.RequestError:
+        metrics.UPSTREAM_RESPONSES.inc("subscription", "error")
+        breaker.record_failure()
+        raise
+
+    metrics.UPSTREAM_RESPONSES.inc("subscription", str(response.status_code))
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
+async def iter_raw(response: httpx.Response) -> AsyncIterator[bytes]:
+    """Relay the still-encoded upstream body and release the connection."""
+    try:
+        async for chunk in response.aiter_raw():
+            yield chunk
+    finally:
+        await response.aclose()
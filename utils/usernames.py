@@ -0,0 +1,51 @@
+import re
+import hashlib
+from db import UserMappingManager
+from utils.log import logger
+
+_NON_WORD = re.compile(r"[^\w]")
+
+
+def translate_username(username: str) -> str:
+    """Derive the Marzneshin username the importer created for a Marzban user."""
+    clean = _NON_WORD.sub("", username.lower())
+    hash_str = str(int(hashlib.md5(username.encode()).hexdigest(), 16) % 10000).zfill(4)
+    return f"{clean}_{hash_str}"[:32]
+
+
+class UsernameIndex:
+    """Marzban -> Marzneshin usernames as recorded by the import step.
+
+    Names without a record, e.g. users imported before the mapping was
+    kept, are translated on the fly; a user missing from the panel is
+    then rejected by the panel lookup.
+    """
+
+    _mapping: dict[str, str] = {}
+
+    @classmethod
+    def resolve(cls, username: str) -> str:
+        return cls._mapping.get(username) or translate_username(username)
+
+    @classmethod
+    async def load(cls) -> int:
+        try:
+            mapping = await UserMappingManager.get_all()
+        except Exception as e:
+            logger.error(f"Error loading username index: {str(e)}")
+            return 0
+
+        if mapping == cls._mapping:
+            return len(mapping)
+
+        owners: dict[str, str] = {}
+        for marzban_username, marzneshin_username in mapping.items():
+            owner = owners.setdefault(marzneshin_username, marzban_username)
+            if owner != marzban_username:
+                logger.warning(
+                    f"Username collision: '{owner}' and '{marzban_username}' both map to '{marzneshin_username}'"
+                )
+
+        cls._mapping = mapping
+        logger.info(f"Loaded {len(mapping)} imported usernames into the index.")
+        return len(mapping)